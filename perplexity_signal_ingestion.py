@@ -1,44 +1,418 @@
 """Phase 1: Signal Ingestion Pipeline - MVP"""
 import os
+import re
+import sys
 import json
+import time
+import hashlib
 import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from urllib.parse import urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+import signal_keys  # noqa: E402  (scripts/ holds the shared aisignal helpers)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 API_KEY = os.getenv("PERPLEXITY_API_KEY", "")
 ENDPOINT = "https://api.perplexity.ai/chat/completions"
+MODEL = "sonar-pro"
+TEMPERATURE = 0.2
+TIMEOUT = 30
 
-def get_signal(symbol):
-    """Fetch one signal from Perplexity"""
-    headers = {
+DEFAULT_SYMBOLS = ["BTC", "ETH"]
+# Wall time is max(slowest call, (symbols - 1) / rate limit): with one worker per
+# symbol only the quota spaces requests out. The default rate matches the
+# 60 req/min Perplexity quota (README-MODERN.md), so 50 symbols take ~49 s to
+# start; raise PERPLEXITY_RATE_LIMIT only on a higher API tier.
+MAX_CONCURRENCY = int(os.getenv("PERPLEXITY_MAX_CONCURRENCY", "0")) or None  # None = one per symbol
+RATE_LIMIT_PER_SEC = float(os.getenv("PERPLEXITY_RATE_LIMIT", "1"))
+
+CACHE_DIR = os.getenv("PERPLEXITY_CACHE_DIR", os.path.join(".cache", "perplexity"))
+CACHE_TTL_SECONDS = int(os.getenv("PERPLEXITY_CACHE_TTL", "900"))
+CACHE_MAX_ENTRIES = int(os.getenv("PERPLEXITY_CACHE_MAX_ENTRIES", "500"))
+
+SUPABASE_PROJECT_ID = os.getenv("SUPABASE_PROJECT_ID", "swfyuwkptusceiouqlks")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
+SUPABASE_URL = f"https://{SUPABASE_PROJECT_ID}.supabase.co/rest/v1"
+
+PROMPT = (
+    "Analyze {symbol} price trend today. Reply with a single JSON object with keys "
+    "pair, direction (BUY, SELL or HOLD), entry, stop_loss, take_profit, "
+    "confidence (0-100) and reasoning."
+)
+JSON_BLOCK = re.compile(r"\{.*\}", re.DOTALL)
+SIGNAL_SOURCE = "perplexity"
+
+# Keys this process has already written; repeats are dropped before the request
+_seen_keys = signal_keys.SeenKeys()
+
+
+class HostRateLimiter:
+    """Spaces request starts per host so a burst never exceeds `rate_per_sec`"""
+
+    def __init__(self, rate_per_sec):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache for chat completion bodies.
+    Entries expire after `ttl` seconds; file mtime doubles as the LRU clock,
+    so the least recently read entries are evicted once `max_entries` is hit.
+    Concurrent misses for the same key share one upstream call.
+    """
+
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._inflight = {}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(model, prompt, temperature):
+        raw = json.dumps([model, prompt, temperature], separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if time.time() - entry.get("stored_at", 0) > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return entry["body"]
+
+    def put(self, key, body):
+        """Best effort: a cache that cannot be written never fails the fetch"""
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"stored_at": time.time(), "body": body}, f)
+            os.replace(tmp, path)
+            self._evict()
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _mtime(entry):
+        try:
+            return entry.stat().st_mtime
+        except OSError:  # removed by another worker or process meanwhile
+            return None
+
+    def _evict(self):
+        entries = [e for e in os.scandir(self.directory) if e.name.endswith(".json")]
+        overflow = len(entries) - self.max_entries
+        if overflow <= 0:
+            return
+        dated = [(self._mtime(e), e) for e in entries]
+        dated = sorted((d for d in dated if d[0] is not None), key=lambda d: d[0])
+        for _, entry in dated[:overflow]:
+            try:
+                os.remove(entry.path)
+                self._count("evictions")
+            except OSError:
+                pass
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Return (status_code, body, source) where source is hit, miss or coalesced.
+        `fetch` must return (status_code, body); only 200 bodies are cached.
+        """
+        body = self.get(key)
+        if body is not None:
+            self._count("hits")
+            return 200, body, "hit"
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        if not leader:
+            self._count("coalesced")
+            status_code, body = future.result()
+            return status_code, body, "coalesced"
+
+        self._count("misses")
+        try:
+            status_code, body = fetch()
+            if status_code == 200 and body is not None:
+                self.put(key, body)
+            future.set_result((status_code, body))
+            return status_code, body, "miss"
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+def build_session(pool_size=len(DEFAULT_SYMBOLS)):
+    """Shared keep-alive session sized for the worker pool"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.headers.update({
         "Authorization": f"Bearer {API_KEY}",
         "Content-Type": "application/json"
+    })
+    return session
+
+
+def _to_float(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = value.replace("$", "").replace(",", "").strip()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_signal(symbol, body):
+    """
+    Extract a latest-signal.json shaped dict from a chat completion body.
+    Returns None when the model did not answer with usable JSON.
+    """
+    try:
+        content = body["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+    match = JSON_BLOCK.search(content or "")
+    if not match:
+        return None
+    try:
+        raw = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(raw, dict):
+        return None
+
+    # The prompt pins 0-100; only a strict fraction is read as the 0-1 format
+    # (so a 1 stays 1%), and anything outside the scale is clamped
+    confidence = _to_float(raw.get("confidence"))
+    if confidence is not None:
+        if 0 < confidence < 1:
+            confidence = confidence * 100
+        confidence = min(max(confidence, 0.0), 100.0)
+
+    return {
+        "pair": str(raw.get("pair") or f"{symbol}/USD").upper(),
+        "direction": str(raw.get("direction") or "HOLD").upper(),
+        "entry": _to_float(raw.get("entry")),
+        "stop_loss": _to_float(raw.get("stop_loss")),
+        "take_profit": _to_float(raw.get("take_profit")),
+        "confidence": confidence,
+        "reasoning": raw.get("reasoning"),
     }
+
+
+def get_signal(symbol, session=None, limiter=None, cache=None):
+    """Fetch one signal from Perplexity, returning its outcome, latency and parsed signal"""
+    prompt = PROMPT.format(symbol=symbol)
     payload = {
-        "model": "sonar-pro",
-        "messages": [{"role": "user", "content": f"Analyze {symbol} price trend today"}],
-        "temperature": 0.2
+        "model": MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": TEMPERATURE
     }
-    
+    result = {"symbol": symbol, "ok": False, "status_code": None, "latency_ms": None,
+              "error": None, "signal": None, "cache": None}
+
+    def fetch():
+        if limiter:
+            limiter.wait(ENDPOINT)
+        if session is None:
+            headers = {
+                "Authorization": f"Bearer {API_KEY}",
+                "Content-Type": "application/json"
+            }
+            resp = requests.post(ENDPOINT, headers=headers, json=payload, timeout=TIMEOUT)
+        else:
+            resp = session.post(ENDPOINT, json=payload, timeout=TIMEOUT)
+        return resp.status_code, (resp.json() if resp.status_code == 200 else None)
+
+    started = time.monotonic()
     try:
-        resp = requests.post(ENDPOINT, headers=headers, json=payload, timeout=30)
-        if resp.status_code == 200:
-            logger.info(f"✅ {symbol}: API responded")
-            return True
+        if cache is None:
+            status_code, body = fetch()
+        else:
+            key = ResponseCache.key(MODEL, prompt, TEMPERATURE)
+            status_code, body, result["cache"] = cache.get_or_fetch(key, fetch)
+        result["status_code"] = status_code
+        if status_code == 200:
+            result["signal"] = parse_signal(symbol, body)
+            result["ok"] = result["signal"] is not None
+            if not result["ok"]:
+                result["error"] = "Unparseable response"
         else:
-            logger.error(f"❌ {symbol}: HTTP {resp.status_code}")
-            return False
+            result["error"] = f"HTTP {status_code}"
     except Exception as e:
-        logger.error(f"❌ {symbol}: {e}")
-        return False
+        result["error"] = str(e)
+    result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+
+    if result["ok"]:
+        source = f" [cache {result['cache']}]" if result["cache"] else ""
+        logger.info(f"✅ {symbol}: API responded in {result['latency_ms']} ms{source}")
+    else:
+        logger.error(f"❌ {symbol}: {result['error']} after {result['latency_ms']} ms")
+    return result
+
+
+def ingest_signals(symbols, concurrency=MAX_CONCURRENCY, rate_limit=RATE_LIMIT_PER_SEC, cache=None):
+    """
+    Fan out get_signal() across symbols with a bounded thread pool.
+    Wall time tracks the slowest call rather than the sum of all calls, or
+    the rate limit's spacing of request starts when that is longer.
+    """
+    concurrency = max(1, min(concurrency or len(symbols), len(symbols) or 1))
+    limiter = HostRateLimiter(rate_limit)
+    started = time.monotonic()
+
+    with build_session(concurrency) as session:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda s: get_signal(s, session, limiter, cache), symbols))
+
+    wall_ms = round((time.monotonic() - started) * 1000, 1)
+    ok = sum(1 for r in results if r["ok"])
+    logger.info(f"📊 {ok}/{len(results)} symbols OK in {wall_ms} ms "
+                f"(concurrency={concurrency}, rate={rate_limit}/s)")
+    run = {"results": results, "wall_ms": wall_ms, "ok": ok, "failed": len(results) - ok}
+    if cache is not None:
+        run["cache"] = dict(cache.stats)
+        logger.info(f"🗄️  Cache: {run['cache']['hits']} hits, {run['cache']['misses']} misses, "
+                    f"{run['cache']['coalesced']} coalesced, {run['cache']['evictions']} evictions")
+    return run
+
+
+def to_aisignal_row(signal):
+    """Map a parsed signal onto the aisignal columns (modern schema)"""
+    confidence = signal["confidence"]
+    return {
+        "pair": signal["pair"],
+        "signal_type": signal["direction"],
+        "entry_price": signal["entry"],
+        "stop_loss": signal["stop_loss"],
+        "take_profit": signal["take_profit"],
+        "confidence_score": int(round(confidence)) if confidence is not None else None,
+        "reasoning": signal["reasoning"],
+        "status": "PENDING"
+    }
+
+
+def persist_signals(signals, session=None):
+    """
+    Write all actionable signals to aisignal in one bulk PostgREST upsert.
+    Each row carries a deterministic signal_key, and rows whose key already
+    exists are ignored, so cron overlaps and retries never duplicate a
+    signal. HOLD signals are dropped. Returns the number of rows sent.
+    """
+    actionable = [to_aisignal_row(s) for s in signals if s["direction"] in ("BUY", "SELL")]
+    keyed = signal_keys.with_keys(actionable, SIGNAL_SOURCE)  # also drops repeats within the batch
+    rows = [r for r in keyed if r[signal_keys.SIGNAL_KEY_COLUMN] not in _seen_keys]
+    if len(rows) < len(actionable):
+        logger.info(f"♻️  Skipped {len(actionable) - len(rows)} duplicate signals (signal_key already seen)")
+    if not rows:
+        logger.info("💤 No actionable signals to persist")
+        return 0
+    if not SUPABASE_SERVICE_ROLE_KEY:
+        logger.warning(f"⚠️  SUPABASE_SERVICE_ROLE_KEY not set, skipping insert of {len(rows)} signals")
+        return 0
+
+    headers = {
+        "apikey": SUPABASE_SERVICE_ROLE_KEY,
+        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+        "Content-Type": "application/json",
+        "Prefer": "resolution=ignore-duplicates,return=minimal"
+    }
+    started = time.monotonic()
+    resp = (session or requests).post(f"{SUPABASE_URL}/aisignal", headers=headers,
+                                      params={"on_conflict": signal_keys.SIGNAL_KEY_COLUMN},
+                                      json=rows, timeout=TIMEOUT)
+    latency_ms = round((time.monotonic() - started) * 1000, 1)
+    if resp.status_code not in (200, 201, 204):
+        logger.error(f"❌ Bulk insert failed: HTTP {resp.status_code} {resp.text[:200]}")
+        return 0
+    for row in rows:  # only after a successful write, so a retry resends them
+        _seen_keys.add(row[signal_keys.SIGNAL_KEY_COLUMN])
+    logger.info(f"💾 Upserted {len(rows)} signals in one request, existing keys skipped ({latency_ms} ms)")
+    return len(rows)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Perplexity signal ingestion')
+    parser.add_argument('--symbols', default=",".join(DEFAULT_SYMBOLS),
+                        help='Comma-separated symbols (default: BTC,ETH)')
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY,
+                        help='Max in-flight requests (default: one per symbol)')
+    parser.add_argument('--rate-limit', type=float, default=RATE_LIMIT_PER_SEC,
+                        help='Max request starts per second per host (default: 1 = the 60 req/min quota; 0 = unlimited)')
+    parser.add_argument('--report', help='Write per-symbol latency/outcome JSON here')
+    parser.add_argument('--no-cache', action='store_true', help='Always call Perplexity, bypassing the response cache')
+    parser.add_argument('--dry-run', action='store_true', help='Parse signals but do not write to aisignal')
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
+    args = parse_args()
     logger.info("🚀 Phase 1 Signal Ingestion Pipeline")
     if not API_KEY:
         logger.error("No PERPLEXITY_API_KEY set")
     else:
-        for symbol in ["BTC", "ETH"]:
-            get_signal(symbol)
+        symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()]
+        cache = None if args.no_cache else ResponseCache()
+        run = ingest_signals(symbols, args.concurrency, args.rate_limit, cache)
+        signals = [r["signal"] for r in run["results"] if r["signal"]]
+        run["persisted"] = 0 if args.dry_run else persist_signals(signals)
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(run, f, indent=2)
         logger.info("✅ Pipeline complete")
@@ -1,93 +1,71 @@
 #!/usr/bin/env python3
 """Adaptive signal insert - discovers and uses working schema automatically"""
-import os
 import sys
-import requests
 import json
 
-SUPABASE_PROJECT_ID = os.environ.get('SUPABASE_PROJECT_ID', 'swfyuwkptusceiouqlks')
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+import aisignal_schema
+import signal_keys
+
+from postgrest_client import SUPABASE_SERVICE_ROLE_KEY, PostgrestClient
 
 if not SUPABASE_SERVICE_ROLE_KEY:
     print("❌ Error: SUPABASE_SERVICE_ROLE_KEY not set")
     sys.exit(1)
 
-BASE_URL = f"https://{SUPABASE_PROJECT_ID}.supabase.co/rest/v1"
-HEADERS = {
-    "apikey": SUPABASE_SERVICE_ROLE_KEY,
-    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-    "Content-Type": "application/json",
-    "Prefer": "return=representation"
-}
+client = PostgrestClient()
+BASE_URL = client.base_url
+HEADERS = {"Prefer": "return=representation"}  # auth, JSON and gzip headers come from the client
 
 print("="*70)
 print("🤖 ADAPTIVE SIGNAL INSERT")
 print("="*70)
 print()
 
-# Try to load cached working schema
-working_schema = None
-try:
-    with open('/tmp/klarpakke_working_schema.json', 'r') as f:
-        working_schema = json.load(f)
-    print("📋 Loaded cached working schema")
-except:
-    print("🔍 No cached schema, will discover...")
-
-print()
+# Step 1: Reuse the last insert plan that worked; discover the schema only without one
+print("1️⃣  Resolving table schema...")
 
-# Step 1: Discover available columns by fetching existing row
-print("1️⃣  Discovering table schema...")
+mapping = aisignal_schema.load_plan(BASE_URL)
+planned = mapping is not None
 
-available_columns = None
-
-try:
-    response = requests.get(f"{BASE_URL}/aisignal?limit=1", headers=HEADERS)
-    if response.status_code == 200:
-        data = response.json()
-        if len(data) > 0:
-            available_columns = set(data[0].keys())
-            print(f"   ✅ Found {len(available_columns)} columns from existing data")
+if planned:
+    print(f"   ✅ Cached insert plan ({aisignal_schema.fingerprint(mapping['columns'])}), fields: {mapping['fields']}")
+else:
+    try:
+        mapping = aisignal_schema.load_mapping(BASE_URL, HEADERS, client)
+        if mapping:
+            print(f"   ✅ {len(mapping['columns'])} columns, fields: {mapping['fields']}")
         else:
-            print("   ⚠️  Table is empty, will try all combinations")
-except Exception as e:
-    print(f"   ⚠️  Could not discover: {e}")
+            print("   ⚠️  Schema not readable and table is empty, will try all combinations")
+    except Exception as e:
+        print(f"   ⚠️  Could not resolve: {e}")
 
 print()
 
-# Step 2: Build signal data based on available columns
+# Step 2: Build signal data in the table's own dialect
 print("2️⃣  Building signal data...")
 
-# All possible field mappings (with prices included)
-field_options = [
-    # Modern schema with prices
-    {"pair": "BTCUSDT", "signal_type": "BUY", "entry_price": 50000, "stop_loss": 49000, "take_profit": 52000, "confidence_score": 80, "status": "PENDING"},
-    # Legacy schema with prices
-    {"symbol": "BTCUSDT", "direction": "LONG", "entry_price": 50000, "stop_loss": 49000, "take_profit": 52000, "confidence": 0.80, "status": "pending"},
-    # Modern without prices
-    {"pair": "BTCUSDT", "signal_type": "BUY", "confidence_score": 80, "status": "PENDING"},
-    # Legacy without prices
-    {"symbol": "BTCUSDT", "direction": "LONG", "confidence": 0.80, "status": "pending"},
-    # Minimal modern
-    {"pair": "BTCUSDT", "signal_type": "BUY", "status": "PENDING"},
-    # Minimal legacy
-    {"symbol": "BTCUSDT", "direction": "LONG", "status": "pending"},
-]
-
-# Filter based on available columns
-if available_columns:
-    print("   📄 Filtering fields based on available columns...")
-    filtered_options = []
-    for option in field_options:
-        if all(key in available_columns for key in option.keys()):
-            filtered_options.append(option)
-            print(f"   ✅ Schema match: {list(option.keys())}")
-    
-    if filtered_options:
-        field_options = filtered_options
-    else:
-        print("   ⚠️  No perfect match, will try all combinations")
+SIGNAL = dict(symbol="BTCUSDT", side="BUY", confidence=0.80, entry_price=50000, stop_loss=49000, take_profit=52000,
+              source="adaptive-insert")
+
+if mapping:
+    field_options = [aisignal_schema.build_insert(mapping, **SIGNAL)]
+    print(f"   ✅ Schema match: {list(field_options[0].keys())}")
 else:
+    # Last resort when the columns are unknown: the historical variants, most complete first
+    field_options = [
+        # Modern schema with prices
+        {"pair": "BTCUSDT", "signal_type": "BUY", "entry_price": 50000, "stop_loss": 49000, "take_profit": 52000, "confidence_score": 80, "status": "PENDING"},
+        # Legacy schema with prices
+        {"symbol": "BTCUSDT", "direction": "LONG", "entry_price": 50000, "stop_loss": 49000, "take_profit": 52000, "confidence": 0.80, "status": "pending"},
+        # Modern without prices
+        {"pair": "BTCUSDT", "signal_type": "BUY", "confidence_score": 80, "status": "PENDING"},
+        # Legacy without prices
+        {"symbol": "BTCUSDT", "direction": "LONG", "confidence": 0.80, "status": "pending"},
+        # Minimal modern
+        {"pair": "BTCUSDT", "signal_type": "BUY", "status": "PENDING"},
+        # Minimal legacy
+        {"symbol": "BTCUSDT", "direction": "LONG", "status": "pending"},
+    ]
     print("   🔮 Using all possible schemas (blind mode)")
 
 print()
@@ -99,9 +77,12 @@ for idx, test_data in enumerate(field_options, 1):
     print(f"\n   Attempt {idx}/{len(field_options)}: {list(test_data.keys())}")
     
     try:
-        response = requests.post(
+        # Keyed payloads upsert: a re-run within the same time bucket is a no-op, not a duplicate
+        keyed = signal_keys.SIGNAL_KEY_COLUMN in test_data
+        response = client.post(
             f"{BASE_URL}/aisignal",
-            headers=HEADERS,
+            params={"on_conflict": signal_keys.SIGNAL_KEY_COLUMN} if keyed else None,
+            headers={**HEADERS, "Prefer": "resolution=ignore-duplicates,return=representation"} if keyed else HEADERS,
             json=test_data
         )
         
@@ -109,6 +90,9 @@ for idx, test_data in enumerate(field_options, 1):
         
         if response.status_code in [200, 201]:
             result = response.json()
+            if not result:
+                print(f"\n✅ Signal already ingested (signal_key {test_data[signal_keys.SIGNAL_KEY_COLUMN]}), nothing to do")
+                sys.exit(0)
             signal_data = result[0] if isinstance(result, list) else result
             
             print("\n" + "="*70)
@@ -119,18 +103,14 @@ for idx, test_data in enumerate(field_options, 1):
             print(json.dumps(signal_data, indent=2, default=str))
             print()
             
-            # Save working schema for future use
-            with open('/tmp/klarpakke_working_schema.json', 'w') as f:
-                json.dump(test_data, f, indent=2)
-            print("💾 Saved working schema to /tmp/klarpakke_working_schema.json")
+            # The returned row is the database's own copy, no separate verify read needed
+            if signal_data.get('id'):
+                print(f"✅ Signal stored in database (id {signal_data['id']})")
             
-            # Verify signal exists
-            signal_id = signal_data.get('id')
-            if signal_id:
-                verify_url = f"{BASE_URL}/aisignal?id=eq.{signal_id}"
-                verify_response = requests.get(verify_url, headers=HEADERS)
-                if verify_response.status_code == 200:
-                    print("✅ Signal verified in database!")
+            # Save the plan for the next run (a blind-mode hit becomes a plan over its own columns)
+            if not planned:
+                aisignal_schema.save_plan(BASE_URL, mapping or aisignal_schema.compile_mapping(test_data))
+                print(f"💾 Saved insert plan to {aisignal_schema.INSERT_PLAN_FILE}")
             
             print()
             print("="*70)
@@ -151,6 +131,14 @@ for idx, test_data in enumerate(field_options, 1):
                 if "'" in error_msg:
                     missing = error_msg.split("'")[1]
                     print(f"   ⚠️  Missing column: {missing}")
+                if mapping and idx == len(field_options):
+                    # Cached plan or column list is stale - re-discover once and retry
+                    print("   🔄 Refreshing cached schema...")
+                    aisignal_schema.invalidate()
+                    fresh = aisignal_schema.load_mapping(BASE_URL, HEADERS, client, refresh=True)
+                    if fresh and fresh['columns'] != mapping['columns']:
+                        mapping, planned = fresh, False
+                        field_options.append(aisignal_schema.build_insert(mapping, **SIGNAL))
     
     except Exception as e:
         print(f"   ❌ Exception: {e}")
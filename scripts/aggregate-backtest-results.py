@@ -3,62 +3,240 @@
 Aggregate backtest results from multiple strategies
 """
 import os
+import re
 import sys
 import json
+import heapq
+import sqlite3
 import argparse
+from bisect import bisect_right
 from pathlib import Path
 from typing import List, Dict
 
+DEFAULT_INDEX = os.path.join('.cache', 'backtest-results-index.sqlite')
+
+# Everything the report reads; equity curves and per-window detail stay in the result files
+SUMMARY_KEYS = ('strategy', 'mode', 'parameters', 'timestamp', 'metrics')
+
+# Equity curves are flat number arrays, so skipping one only needs the closing bracket
+CURVE_KEY = re.compile(r'"equity_curve"\s*:\s*\[')
+CHUNK_SIZE = 1 << 20
+
+TOP_K = 10
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Aggregate backtest results')
     parser.add_argument('--input-dir', required=True, help='Directory with backtest results')
     parser.add_argument('--output', required=True, help='Output markdown file')
+    parser.add_argument('--index', default=DEFAULT_INDEX,
+                        help='SQLite results index; only new or changed files are re-parsed')
+    parser.add_argument('--no-index', action='store_true', help='Parse every file, ignore the index')
+    parser.add_argument('--top', type=int, default=TOP_K, help='Number of runs in the ranking table')
     return parser.parse_args()
 
-def load_results(input_dir: str) -> List[Dict]:
+def summarize(run: Dict) -> Dict:
+    """
+    Ranking data for one run, without the bulky equity curve
+    """
+    summary = {key: run[key] for key in SUMMARY_KEYS if key in run}
+    summary['metrics'] = {k: v for k, v in run.get('metrics', {}).items() if k != 'equity_curve'}
+    return summary
+
+def read_without_curves(f, chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    Read a result file in chunks, replacing every equity_curve array with null
+    on the way so the curves never reach memory, whatever their length
+    """
+    kept = []
+    buffer = ''
+    in_curve = False
+    for chunk in iter(lambda: f.read(chunk_size), ''):
+        buffer += chunk
+        while True:
+            if in_curve:
+                end = buffer.find(']')
+                if end < 0:
+                    buffer = ''
+                    break
+                buffer = buffer[end + 1:]
+                in_curve = False
+            match = CURVE_KEY.search(buffer)
+            if match:
+                kept.append(buffer[:match.start()])
+                kept.append('"equity_curve": null')
+                buffer = buffer[match.end():]
+                in_curve = True
+                continue
+            # Hold back a tail in case a key straddles the chunk boundary
+            cut = max(len(buffer) - 64, 0)
+            kept.append(buffer[:cut])
+            buffer = buffer[cut:]
+            break
+    kept.append(buffer)
+    return ''.join(kept)
+
+def parse_result_file(json_file: Path) -> List[Dict]:
+    """
+    Run summaries from one result file (a sweep file holds a whole parameter grid)
+    """
+    with open(json_file, 'r') as f:
+        data = json.loads(read_without_curves(f))
+    runs = data['results'] if isinstance(data.get('results'), list) else [data]
+    return [summarize(run) for run in runs]
+
+def open_index(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS runs (
+            path TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            summary TEXT NOT NULL,
+            PRIMARY KEY (path, position)
+        );
+    """)
+    return db
+
+def load_results(input_dir: str, index_path: str = None) -> List[Dict]:
     """
-    Load all JSON results from directory
+    Load run summaries from all JSON results under input_dir.
+    With an index, files whose (mtime, size) are unchanged since the last run
+    are served from SQLite instead of being parsed again.
     """
-    results = []
-    input_path = Path(input_dir)
+    input_path = Path(input_dir).resolve()
     
     print(f"💾 Loading results from {input_dir}...")
     
+    db = open_index(index_path) if index_path else None
+    known = {}
+    if db:
+        prefix = f"{input_path}{os.sep}"
+        known = {path: (mtime_ns, size) for path, mtime_ns, size in
+                 db.execute("SELECT path, mtime_ns, size FROM files WHERE substr(path, 1, ?) = ?",
+                            (len(prefix), prefix))}
+    
+    seen = set()
+    parsed = cached = 0
     # Recursively find all .json files
-    for json_file in input_path.rglob('*.json'):
+    for json_file in sorted(input_path.rglob('*.json')):
+        path = str(json_file)
+        stat = json_file.stat()
+        seen.add(path)
+        if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+            cached += 1
+            continue
         try:
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-                results.append(data)
-                print(f"  ✅ Loaded: {json_file.name}")
+            summaries = parse_result_file(json_file)
         except Exception as e:
             print(f"  ⚠️  Skipped {json_file.name}: {e}")
+            continue
+        parsed += 1
+        suffix = f" ({len(summaries)} sweep runs)" if len(summaries) > 1 else ""
+        print(f"  ✅ Loaded: {json_file.name}{suffix}")
+        if db:
+            db.execute("DELETE FROM runs WHERE path = ?", (path,))
+            db.executemany("INSERT INTO runs (path, position, summary) VALUES (?, ?, ?)",
+                           ((path, i, json.dumps(s)) for i, s in enumerate(summaries)))
+            db.execute("INSERT OR REPLACE INTO files (path, mtime_ns, size) VALUES (?, ?, ?)",
+                       (path, stat.st_mtime_ns, stat.st_size))
+        else:
+            known[path] = summaries
+    
+    if db:
+        # Forget files that disappeared since the last run
+        gone = [(path,) for path in known if path not in seen]
+        db.executemany("DELETE FROM runs WHERE path = ?", gone)
+        db.executemany("DELETE FROM files WHERE path = ?", gone)
+        db.commit()
+        results = [json.loads(summary) for path, summary in
+                   db.execute("SELECT path, summary FROM runs ORDER BY path, position")
+                   if path in seen]
+        db.close()
+        print(f"  🗂️  Index: {parsed} parsed, {cached} unchanged, {len(gone)} removed")
+    else:
+        results = [summary for path in sorted(known) for summary in known[path]]
     
     print(f"\n✅ Loaded {len(results)} backtest results\n")
     return results
 
-def generate_markdown_report(results: List[Dict]) -> str:
+def _objectives(result: Dict):
+    metrics = result['metrics']
+    return (metrics.get('total_profit_percent', 0), metrics.get('max_drawdown_percent', 0),
+            metrics.get('winrate', 0))
+
+def _traded(result: Dict) -> bool:
+    return result['metrics'].get('total_trades', 0) > 0
+
+def pareto_front(results: List[Dict]) -> List[Dict]:
     """
-    Generate markdown comparison report
+    Runs not dominated on (max profit, min drawdown, max winrate), best profit first.
+    
+    Sort by profit, then sweep while keeping the (drawdown, winrate) staircase
+    of everything seen so far: drawdown ascending, winrate strictly rising.
+    A run is dominated iff the staircase step at its drawdown already has a
+    winrate at least as high. O(n log n) plus list inserts on a small front.
+    Runs with identical objectives keep only the first. Runs without trades
+    have no drawdown to lose and are left out.
+    """
+    ordered = sorted((r for r in results if _traded(r)), key=lambda r: (-r['metrics'].get('total_profit_percent', 0),
+                                             r['metrics'].get('max_drawdown_percent', 0),
+                                             -r['metrics'].get('winrate', 0)))
+    front = []
+    drawdowns, winrates = [], []
+    for result in ordered:
+        _, drawdown, winrate = _objectives(result)
+        step = bisect_right(drawdowns, drawdown)
+        if step and winrates[step - 1] >= winrate:
+            continue
+        front.append(result)
+        # Drop staircase points the new one dominates in (drawdown, winrate)
+        end = step
+        while end < len(drawdowns) and winrates[end] <= winrate:
+            end += 1
+        drawdowns[step:end] = [drawdown]
+        winrates[step:end] = [winrate]
+    return front
+
+def generate_markdown_report(results: List[Dict], top_k: int = TOP_K) -> str:
+    """
+    Generate markdown comparison report: top-K ranking plus the Pareto-optimal runs in detail
     """
     if not results:
         return "## ⚠️ No Results Found\n\nNo backtest results were found to aggregate."
     
-    # Sort by total profit
-    results_sorted = sorted(results, key=lambda x: x['metrics'].get('total_profit_percent', 0), reverse=True)
+    # Runs without trades (metrics are just an error) are not ranked
+    traded = [r for r in results if _traded(r)]
+    if not traded:
+        return (f"## ⚠️ No Trades\n\nNone of the {len(results)} backtest results "
+                "had any trades matching its criteria.")
+    
+    # Top-K by total profit without sorting everything
+    results_sorted = heapq.nlargest(top_k, traded, key=lambda x: x['metrics'].get('total_profit_percent', 0))
+    front = pareto_front(traded)
     
     report = []
     report.append("# 📊 Backtest Comparison Report")
     report.append("")
     report.append(f"**Generated:** {results[0].get('timestamp', 'N/A')}")
     report.append(f"**Strategies Tested:** {len(results)}")
+    if len(traded) < len(results):
+        report.append(f"**Without Trades:** {len(results) - len(traded)} (not ranked)")
+    report.append(f"**Pareto-Optimal:** {len(front)} (profit ↑, max drawdown ↓, winrate ↑)")
     report.append("")
     
     # Summary table
     report.append("## 🏆 Performance Ranking")
     report.append("")
-    report.append("| Rank | Strategy | Winrate | Avg R | Profit | Max DD |")
-    report.append("|------|----------|---------|-------|--------|--------|")
+    if len(traded) > top_k:
+        report.append(f"Top {top_k} of {len(traded)} by total profit.")
+        report.append("")
+    report.append("| Rank | Strategy | Winrate | Avg R | Profit | Gross | Max DD |")
+    report.append("|------|----------|---------|-------|--------|-------|--------|")
     
     medals = ["🥇", "🥈", "🥉"]
     
@@ -71,16 +249,19 @@ def generate_markdown_report(results: List[Dict]) -> str:
         avg_r = f"{metrics.get('avg_r_multiple', 0):.2f}x"
         profit = f"+{metrics.get('total_profit_percent', 0):.1f}%"
         dd = f"{metrics.get('max_drawdown_percent', 0):.1f}%"
+        gross = f"{metrics['gross']['total_profit_percent']:+.1f}%" if 'gross' in metrics else "-"
         
-        report.append(f"| {medal} | {strategy} | {winrate} | {avg_r} | {profit} | {dd} |")
+        report.append(f"| {medal} | {strategy} | {winrate} | {avg_r} | {profit} | {gross} | {dd} |")
     
     report.append("")
     
     # Detailed results
-    report.append("## 📊 Detailed Results")
+    report.append("## 📊 Pareto-Optimal Configurations")
+    report.append("")
+    report.append("No other run has higher profit, lower drawdown and higher winrate at once.")
     report.append("")
     
-    for idx, result in enumerate(results_sorted):
+    for idx, result in enumerate(front):
         strategy = result['strategy'].capitalize()
         params = result['parameters']
         metrics = result['metrics']
@@ -107,6 +288,9 @@ def generate_markdown_report(results: List[Dict]) -> str:
         report.append(f"- Max Drawdown: {metrics.get('max_drawdown_percent', 0):.1f}%")
         report.append(f"- Final Capital: ${metrics.get('final_capital', 0):,.2f}")
         report.append(f"- Total Profit: ${metrics.get('total_profit', 0):,.2f} ({metrics.get('total_profit_percent', 0):+.1f}%)")
+        if 'gross' in metrics:
+            report.append(f"- Gross Profit: {metrics['gross']['total_profit_percent']:+.1f}% "
+                          f"(costs: -{metrics.get('cost_drag_percent', 0):.1f}%)")
         report.append("")
     
     # Recommendations
@@ -122,14 +306,14 @@ def generate_markdown_report(results: List[Dict]) -> str:
     report.append(f"  - Achieved {best_profit:+.1f}% profit with {best_winrate:.1f}% winrate")
     report.append("")
     
-    # Find highest winrate
-    highest_winrate = max(results, key=lambda x: x['metrics'].get('winrate', 0))
+    # Highest winrate is always on the Pareto front
+    highest_winrate = max(front, key=lambda x: x['metrics'].get('winrate', 0))
     report.append(f"🛡️ **Safest:** {highest_winrate['strategy'].capitalize()} strategy")
     report.append(f"  - Highest winrate: {highest_winrate['metrics'].get('winrate', 0)*100:.1f}%")
     report.append("")
     
     # Find highest R
-    highest_r = max(results, key=lambda x: x['metrics'].get('avg_r_multiple', 0))
+    highest_r = max(traded, key=lambda x: x['metrics'].get('avg_r_multiple', 0))
     report.append(f"🚀 **Most Aggressive:** {highest_r['strategy'].capitalize()} strategy")
     report.append(f"  - Highest avg R: {highest_r['metrics'].get('avg_r_multiple', 0):.2f}x")
     report.append("")
@@ -149,7 +333,7 @@ def main():
     print()
     
     # Load results
-    results = load_results(args.input_dir)
+    results = load_results(args.input_dir, None if args.no_index else args.index)
     
     if not results:
         print("⚠️  No results found!")
@@ -157,7 +341,7 @@ def main():
     
     # Generate report
     print("📝 Generating markdown report...")
-    report = generate_markdown_report(results)
+    report = generate_markdown_report(results, args.top)
     
     # Save report
     with open(args.output, 'w') as f:
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+aisignal schema resolver - one column lookup, cached on disk, compiled to a fixed field mapping
+"""
+import os
+import json
+import time
+import hashlib
+from typing import Dict, Iterable, Optional
+
+import requests
+
+import signal_keys
+
+SCHEMA_CACHE_FILE = os.environ.get('AISIGNAL_SCHEMA_CACHE', '/tmp/klarpakke_aisignal_columns.json')
+SCHEMA_CACHE_TTL = int(os.environ.get('AISIGNAL_SCHEMA_TTL', '3600'))
+INSERT_PLAN_FILE = os.environ.get('AISIGNAL_INSERT_PLAN', '/tmp/klarpakke_working_schema.json')
+REQUEST_TIMEOUT = 15
+TABLE = 'aisignal'
+
+# Logical field -> column variants, preferred first (modern schema, then legacy)
+FIELD_VARIANTS = {
+    "symbol": ("pair", "symbol"),
+    "side": ("signal_type", "direction"),
+    "confidence": ("confidence_score", "confidence"),
+    "entry_price": ("entry_price",),
+    "stop_loss": ("stop_loss",),
+    "take_profit": ("take_profit",),
+    "status": ("status",),
+    "reasoning": ("reasoning",),
+}
+
+# How each side column spells a trade direction
+SIDE_VALUES = {
+    "signal_type": {"BUY": "BUY", "LONG": "BUY", "SELL": "SELL", "SHORT": "SELL"},
+    "direction": {"BUY": "LONG", "LONG": "LONG", "SELL": "SHORT", "SHORT": "SHORT"},
+}
+
+
+def fetch_columns(base_url: str, headers: Dict, session: Optional[requests.Session] = None) -> Optional[list]:
+    """
+    Column names of aisignal from the PostgREST OpenAPI root, or from one
+    sample row when the root is not readable. None if neither works.
+    """
+    http = session or requests
+    response = http.get(f"{base_url}/", headers={**headers, "Accept": "application/openapi+json"},
+                        timeout=REQUEST_TIMEOUT)
+    if response.status_code == 200:
+        definition = response.json().get('definitions', {}).get(TABLE)
+        if definition and definition.get('properties'):
+            return sorted(definition['properties'])
+    response = http.get(f"{base_url}/{TABLE}?limit=1", headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 200 and response.json():
+        return sorted(response.json()[0])
+    return None
+
+
+def _read_cache(base_url: str, ttl: int) -> Optional[list]:
+    try:
+        with open(SCHEMA_CACHE_FILE, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('base_url') != base_url or time.time() - cached.get('fetched_at', 0) > ttl:
+        return None
+    return cached.get('columns')
+
+
+def _write_json(path: str, data: Dict) -> None:
+    try:
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+    except OSError:
+        pass  # the caches are an optimisation only
+
+
+def _write_cache(base_url: str, columns: list) -> None:
+    _write_json(SCHEMA_CACHE_FILE, {"base_url": base_url, "fetched_at": time.time(), "columns": columns})
+
+
+def invalidate() -> None:
+    """Drop the column cache and the insert plan built from it"""
+    for path in (SCHEMA_CACHE_FILE, INSERT_PLAN_FILE):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def load_columns(base_url: str, headers: Dict, session: Optional[requests.Session] = None,
+                 refresh: bool = False, ttl: int = SCHEMA_CACHE_TTL) -> Optional[list]:
+    """
+    aisignal columns, served from the disk cache while it is younger than ttl
+    """
+    columns = None if refresh else _read_cache(base_url, ttl)
+    if columns is None:
+        columns = fetch_columns(base_url, headers, session)
+        if columns:
+            _write_cache(base_url, columns)
+    return columns
+
+
+def compile_mapping(columns: Iterable[str]) -> Dict:
+    """
+    Resolve every logical field to one concrete column (None if absent).
+    The first variant present wins, as the per-row probing it replaces did.
+    """
+    columns = set(columns)
+    fields = {name: next((c for c in variants if c in columns), None)
+              for name, variants in FIELD_VARIANTS.items()}
+    return {
+        "columns": sorted(columns),
+        "fields": fields,
+        # Modern rows use BUY/SELL + PENDING, legacy rows LONG/SHORT + pending
+        "status_case": 'upper' if fields['side'] == 'signal_type' else 'lower',
+    }
+
+
+def load_mapping(base_url: str, headers: Dict, session: Optional[requests.Session] = None,
+                 refresh: bool = False) -> Optional[Dict]:
+    columns = load_columns(base_url, headers, session, refresh)
+    return compile_mapping(columns) if columns else None
+
+
+def fingerprint(columns: Iterable[str]) -> str:
+    return hashlib.sha256('\n'.join(sorted(columns)).encode()).hexdigest()[:16]
+
+
+def save_plan(base_url: str, mapping: Dict) -> None:
+    """Persist a mapping that has just produced a successful insert"""
+    _write_json(INSERT_PLAN_FILE, {"base_url": base_url, "fingerprint": fingerprint(mapping['columns']),
+                                   "saved_at": time.time(), "mapping": mapping})
+
+
+def load_plan(base_url: str) -> Optional[Dict]:
+    """
+    Last mapping that worked, with no request: trusted unless the column
+    cache (at any age - a newer lookup by another script counts) has a
+    different fingerprint. A failed insert calls invalidate() instead.
+    """
+    try:
+        with open(INSERT_PLAN_FILE, 'r') as f:
+            plan = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(plan, dict) or plan.get('base_url') != base_url or 'mapping' not in plan:
+        return None  # other project, or the bare payload older versions saved
+    columns = _read_cache(base_url, float('inf'))
+    if columns is not None and fingerprint(columns) != plan.get('fingerprint'):
+        return None
+    return plan['mapping']
+
+
+def read_signal(mapping: Dict, row: Dict) -> Dict:
+    """
+    Logical view of one row; confidence is normalised to a 0-100 integer
+    (None when missing)
+    """
+    fields = mapping['fields']
+    confidence = row.get(fields['confidence']) if fields['confidence'] else None
+    if confidence is not None:
+        confidence = int(confidence * 100) if confidence < 1.5 else int(confidence)
+    return {
+        "symbol": row.get(fields['symbol']) if fields['symbol'] else None,
+        "side": row.get(fields['side']) if fields['side'] else None,
+        "confidence": confidence,
+    }
+
+
+def build_insert(mapping: Dict, symbol: str, side: str, confidence: float,
+                 entry_price: float = None, stop_loss: float = None, take_profit: float = None,
+                 status: str = 'PENDING', reasoning: str = None, source: str = None) -> Dict:
+    """
+    Insert payload in this table's own dialect. confidence is 0-1; only
+    columns the table has are included. With a source, a signal_key is
+    stamped too when the table has that column (see signal_keys.py).
+    """
+    fields = mapping['fields']
+    values = {
+        "symbol": symbol,
+        "side": SIDE_VALUES.get(fields['side'], {}).get(side.upper(), side),
+        "confidence": round(confidence * 100) if fields['confidence'] == 'confidence_score' else confidence,
+        "entry_price": entry_price,
+        "stop_loss": stop_loss,
+        "take_profit": take_profit,
+        "status": status.upper() if mapping['status_case'] == 'upper' else status.lower(),
+        "reasoning": reasoning,
+    }
+    payload = {fields[name]: value for name, value in values.items() if fields[name] and value is not None}
+    if source is not None and signal_keys.SIGNAL_KEY_COLUMN in mapping['columns']:
+        payload[signal_keys.SIGNAL_KEY_COLUMN] = signal_keys.signal_key(symbol, side, entry_price, source=source)
+    return payload
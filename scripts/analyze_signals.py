@@ -2,71 +2,177 @@
 """Adaptive signal analysis - works with any schema variation"""
 import os
 import sys
+import time
+import select
+import socket
+import argparse
 import requests
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import json
 
-SUPABASE_PROJECT_ID = os.environ.get('SUPABASE_PROJECT_ID', 'swfyuwkptusceiouqlks')
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+import aisignal_schema
+
+try:
+    import psycopg2
+except ImportError:  # only needed for --daemon
+    psycopg2 = None
+
+from postgrest_client import SUPABASE_SERVICE_ROLE_KEY, PostgrestClient
 
 if not SUPABASE_SERVICE_ROLE_KEY:
     print("❌ Error: SUPABASE_SERVICE_ROLE_KEY not set")
     sys.exit(1)
 
-BASE_URL = f"https://{SUPABASE_PROJECT_ID}.supabase.co/rest/v1"
-HEADERS = {
-    "apikey": SUPABASE_SERVICE_ROLE_KEY,
-    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-    "Content-Type": "application/json",
-    "Prefer": "return=representation"
+client = PostgrestClient()
+BASE_URL = client.base_url
+HEADERS = {"Prefer": "return=representation"}  # auth, JSON and gzip headers come from the client
+
+# ids per id=in.(...) filter - keeps the PATCH URL well under proxy limits
+ID_BATCH_SIZE = 200
+PAGE_SIZE = int(os.environ.get('ANALYZE_PAGE_SIZE', '1000'))
+STATUS_FORMATS = ['PENDING', 'pending', 'Pending']
+
+# Daemon mode: LISTEN needs a session connection (direct or session pooler, not the :6543 transaction pooler)
+SUPABASE_DB_URL = os.environ.get('SUPABASE_DB_URL')
+NOTIFY_CHANNEL = 'aisignal_inserted'  # see supabase/migrations/20261018_aisignal_insert_notify.sql
+SWEEP_INTERVAL = 60
+
+# Claim leases (supabase/migrations/20261018_aisignal_claims.sql) let several workers share the queue
+WORKER_ID = os.environ.get('ANALYZER_WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+CLAIM_LEASE_SECONDS = int(os.environ.get('ANALYZE_CLAIM_LEASE', '300'))
+
+METADATA_COLUMNS = {'reasoning', 'approved_by', 'approved_at', 'rejected_by', 'rejected_at'}
+
+# One reasoning per decision so each status is a single bulk PATCH group; the score itself is on the row
+REASONING = {
+    "APPROVED": "High confidence (>= 75%)",
+    "PENDING": "Medium confidence (60-74%) - needs review",
+    "REJECTED": "Low confidence (< 60%)",
 }
 
-def get_field(signal, field_variations):
-    """Get field value, trying multiple variations"""
-    for field in field_variations:
-        if field in signal:
-            return signal[field]
-    return None
-
-def fetch_pending_signals():
-    """Fetch pending signals, trying multiple status formats"""
-    # Try different status values
-    for status_value in ['PENDING', 'pending', 'Pending']:
-        url = f"{BASE_URL}/aisignal?status=eq.{status_value}&order=created_at.desc&limit=10"
+# Resolved once per process
+status_format = None
+field_mapping = None
+metadata_supported = True
+claims_supported = True
+
+round_trips = []  # (label, status code, rows, milliseconds)
+
+def timed_request(method, url, label, rows=0, **kwargs):
+    """Send one request on the shared client and record its round trip"""
+    started = time.perf_counter()
+    response = client.request(method, url, **kwargs)
+    round_trips.append((label, response.status_code, rows, (time.perf_counter() - started) * 1000))
+    return response
+
+def resolve_field_mapping():
+    """
+    Compile the column mapping once per process from the cached schema resolver.
+    Knowing the columns also settles whether the metadata fields can be sent.
+    """
+    global field_mapping, metadata_supported
+    try:
+        field_mapping = aisignal_schema.load_mapping(BASE_URL, HEADERS, client)
+    except requests.RequestException as e:
+        print(f"⚠️  Could not resolve schema, will map from the first row: {e}")
+    if field_mapping:
+        columns = set(field_mapping['columns'])
+        metadata_supported = METADATA_COLUMNS <= columns
+        print(f"🧭 Schema: {len(columns)} columns, fields {field_mapping['fields']}")
+    return field_mapping
+
+def resolve_status_format():
+    """Find which status casing this database uses, with one request per process"""
+    global status_format
+    if status_format is None:
+        url = f"{BASE_URL}/aisignal?status=in.({','.join(STATUS_FORMATS)})&select=status&limit=1"
+        status_format = 'PENDING'
         try:
-            response = requests.get(url, headers=HEADERS)
-            if response.status_code == 200:
-                data = response.json()
-                if len(data) > 0:
-                    return data, status_value
-        except:
-            continue
+            response = timed_request('GET', url, "GET status casing", headers=HEADERS)
+            if response.status_code == 200 and response.json():
+                status_format = response.json()[0]['status']
+        except Exception as e:
+            print(f"⚠️  Could not resolve status casing, assuming PENDING: {e}")
+    return status_format
+
+def fetch_pending_page(status_value, cursor=None):
+    """
+    One page of pending signals, oldest first, strictly after the
+    (created_at, id) cursor. Keyset pagination skips rows kept as PENDING
+    without re-reading them.
+    """
+    params = [
+        ("status", f"eq.{status_value}"),
+        ("order", "created_at.asc,id.asc"),
+        ("limit", str(PAGE_SIZE)),
+    ]
+    if cursor:
+        created_at, signal_id = cursor
+        params.append(("or", f'(created_at.gt."{created_at}",'
+                             f'and(created_at.eq."{created_at}",id.gt.{signal_id}))'))
+    response = timed_request('GET', f"{BASE_URL}/aisignal", "GET pending page", headers=HEADERS, params=params)
+    response.raise_for_status()
+    return response.json()
+
+def claim_signals(status_value, ids=None):
+    """
+    Claim up to PAGE_SIZE pending signals (or just `ids`) for this worker.
+    Rows locked or leased by another worker are skipped, so concurrent
+    workers never get the same row. Returns None if the RPC is not deployed.
+    """
+    global claims_supported
+    if not claims_supported:
+        return None
+    payload = {
+        "p_worker": WORKER_ID,
+        "p_status": status_value,
+        "p_limit": PAGE_SIZE,
+        "p_lease_seconds": CLAIM_LEASE_SECONDS,
+        "p_ids": ids,
+    }
+    response = timed_request('POST', f"{BASE_URL}/rpc/claim_pending_signals", "POST claim", headers=HEADERS,
+                             json=payload)
+    if response.status_code == 404:
+        claims_supported = False
+        print("⚠️  claim_pending_signals() not deployed - running without claims, do not start several workers")
+        return None
+    response.raise_for_status()
+    return response.json()
+
+def iter_pending_pages(status_value):
+    """
+    Yield the whole pending queue page by page, as claimed batches or, without
+    the claim RPC, keyset pages. The next page is fetched in the background
+    while the caller analyzes and updates the current one.
+    """
+    page = claim_signals(status_value)
+    if page is not None:
+        fetch_next = lambda page: claim_signals(status_value)
+    else:
+        page = fetch_pending_page(status_value)
+        fetch_next = lambda page: fetch_pending_page(status_value, (page[-1]['created_at'], page[-1]['id']))
     
-    # If no pending found with any status, return empty
-    return [], 'PENDING'
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        while page:
+            future = prefetcher.submit(fetch_next, page) if len(page) == PAGE_SIZE else None
+            yield page
+            page = future.result() if future else None
 
 def analyze_signal(signal):
     """
     Adaptive signal analysis - works with multiple schema variations
     """
+    global field_mapping
     signal_id = signal['id']
     
-    # Get pair/symbol (try both)
-    pair = get_field(signal, ['pair', 'symbol']) or 'UNKNOWN'
-    
-    # Get signal_type/direction (try both)
-    signal_type = get_field(signal, ['signal_type', 'direction']) or 'UNKNOWN'
-    
-    # Get confidence (try both formats: 0-100 or 0-1)
-    confidence_score = get_field(signal, ['confidence_score', 'confidence'])
-    if confidence_score is not None:
-        # Normalize to 0-100 scale
-        if confidence_score < 1.5:  # Assume 0-1 format
-            confidence_score = int(confidence_score * 100)
-        else:
-            confidence_score = int(confidence_score)
-    else:
-        confidence_score = 50  # Default if missing
+    if field_mapping is None:
+        # No resolver result: the first row's keys stand in for the column list
+        field_mapping = aisignal_schema.compile_mapping(signal)
+    fields = aisignal_schema.read_signal(field_mapping, signal)
+    pair = fields['symbol'] or 'UNKNOWN'
+    signal_type = fields['side'] or 'UNKNOWN'
+    confidence_score = fields['confidence'] if fields['confidence'] is not None else 50  # Default if missing
     
     print(f"\n📊 Signal {signal_id[:8] if isinstance(signal_id, str) else signal_id}: {pair} {signal_type}")
     print(f"   Confidence: {confidence_score}%")
@@ -74,108 +180,305 @@ def analyze_signal(signal):
     # Decision logic based on confidence score
     if confidence_score >= 75:
         decision = "APPROVED"
-        reasoning = f"High confidence: {confidence_score}%"
     elif confidence_score >= 60:
         decision = "PENDING"
-        reasoning = f"Medium confidence: {confidence_score}% - needs review"
     else:
         decision = "REJECTED"
-        reasoning = f"Low confidence: {confidence_score}%"
+    reasoning = REASONING[decision]
     
     print(f"   Decision: {decision}")
     print(f"   Reasoning: {reasoning}")
     
     return decision, reasoning
 
-def update_signal(signal_id, decision, reasoning, status_format='PENDING'):
-    """Update signal status - adapts to available columns"""
-    url = f"{BASE_URL}/aisignal?id=eq.{signal_id}"
-    
-    timestamp = datetime.utcnow().isoformat()
-    
-    # Match status format (UPPER, lower, or Title)
+def format_status(decision, status_format='PENDING'):
+    """Match status format (UPPER, lower, or Title)"""
     if status_format == status_format.upper():
-        status_value = decision.upper()
+        return decision.upper()
     elif status_format == status_format.lower():
-        status_value = decision.lower()
-    else:
-        status_value = decision.title()
+        return decision.lower()
+    return decision.title()
+
+def patch_batches(ids, update_data, label, headers):
+    """PATCH update_data onto ids, ID_BATCH_SIZE at a time; yields (batch, response)"""
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        batch = ids[start:start + ID_BATCH_SIZE]
+        url = f"{BASE_URL}/aisignal?id=in.({','.join(str(i) for i in batch)})"
+        if claims_supported:
+            # Only rows this worker still holds - a lapsed lease may have moved on
+            url += f"&claimed_by=eq.{WORKER_ID}"
+        yield batch, timed_request('PATCH', url, label, len(batch), headers=headers, json=update_data)
+
+def update_signals(decisions, status_format='PENDING'):
+    """
+    Apply decisions in bulk with PATCH id=in.(...) in batches of ID_BATCH_SIZE.
+    Returns updated counts per decision.
     
-    update_data = {
-        "status": status_value
-    }
+    With metadata (reasoning, approved_by/at, rejected_by/at) there is one
+    group per (status, reasoning) - one per status, as REASONING is. If the
+    first PATCH is rejected with 400 a column is missing, and everything
+    left is sent as one status-only group per status.
+    """
+    groups = {}
+    for signal_id, decision, reasoning in decisions:
+        groups.setdefault((decision, reasoning), []).append(signal_id)
     
-    # Try to add metadata fields if they exist
-    if decision == "APPROVED":
-        update_data["approved_by"] = "github_actions"
-        update_data["approved_at"] = timestamp
-    elif decision == "REJECTED":
-        update_data["rejected_by"] = "github_actions"
-        update_data["rejected_at"] = timestamp
+    global metadata_supported
+    timestamp = datetime.utcnow().isoformat()
+    headers = {**HEADERS, "Prefer": "return=minimal"}
+    updated = {}
+    applied = set()
     
-    # Try to add reasoning if column exists
-    update_data["reasoning"] = reasoning
+    def record(decision, batch, response):
+        if response.status_code in [200, 204]:
+            updated[decision] = updated.get(decision, 0) + len(batch)
+        else:
+            print(f"   ❌ Failed to update {len(batch)} signals to {decision}: HTTP {response.status_code}")
+        applied.update(batch)
     
+    with_metadata = metadata_supported
     try:
-        response = requests.patch(url, headers=HEADERS, json=update_data)
+        for (decision, reasoning), ids in groups.items():
+            status_value = format_status(decision, status_format)
+            update_data = {"status": status_value}
+            
+            # Try to add metadata fields if they exist
+            if decision == "APPROVED":
+                update_data["approved_by"] = "github_actions"
+                update_data["approved_at"] = timestamp
+            elif decision == "REJECTED":
+                update_data["rejected_by"] = "github_actions"
+                update_data["rejected_at"] = timestamp
+            update_data["reasoning"] = reasoning
+            
+            if not with_metadata:
+                break
+            for batch, response in patch_batches(ids, update_data, f"PATCH {status_value}", headers):
+                if response.status_code == 400:
+                    # Column might not exist, continue without optional fields for the rest of the run
+                    with_metadata = metadata_supported = False
+                    break
+                record(decision, batch, response)
         
-        if response.status_code in [200, 204]:
-            return True
-        elif response.status_code == 400:
-            # Column might not exist, try without optional fields
-            update_data_minimal = {"status": status_value}
-            response = requests.patch(url, headers=HEADERS, json=update_data_minimal)
-            return response.status_code in [200, 204]
-        else:
-            return False
+        if not with_metadata:
+            by_status = {}
+            for signal_id, decision, _ in decisions:
+                if signal_id not in applied:
+                    by_status.setdefault(decision, []).append(signal_id)
+            for decision, ids in by_status.items():
+                status_value = format_status(decision, status_format)
+                for batch, response in patch_batches(ids, {"status": status_value},
+                                                     f"PATCH {status_value} (minimal)", headers):
+                    record(decision, batch, response)
     except Exception as e:
         print(f"   ⚠️  Update error: {e}")
-        return False
+    
+    return updated
+
+def print_round_trips():
+    """Summarise this run's requests, grouped by kind"""
+    if not round_trips:
+        return
+    kinds = {}
+    for label, status_code, rows, ms in round_trips:
+        kind = kinds.setdefault(label, {"count": 0, "rows": 0, "ms": 0.0, "max_ms": 0.0, "codes": set()})
+        kind["count"] += 1
+        kind["rows"] += rows
+        kind["ms"] += ms
+        kind["max_ms"] = max(kind["max_ms"], ms)
+        kind["codes"].add(status_code)
+    total_ms = sum(ms for _, _, _, ms in round_trips)
+    print(f"\n⏱️  {len(round_trips)} round trips, {total_ms:.0f} ms total")
+    for label, kind in kinds.items():
+        codes = ','.join(str(c) for c in sorted(kind['codes']))
+        print(f"   {label:<28} x{kind['count']:<4} HTTP {codes:<8} {kind['rows']:>6} rows  "
+              f"avg {kind['ms'] / kind['count']:7.1f} ms  max {kind['max_ms']:7.1f} ms")
+
+def fetch_signals_by_id(ids, status_value):
+    """Notified signals that are still pending (and, with claims, not taken by another worker)"""
+    claimed = claim_signals(status_value, ids)
+    if claimed is not None:
+        return claimed
+    rows = []
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        batch = ids[start:start + ID_BATCH_SIZE]
+        url = f"{BASE_URL}/aisignal?id=in.({','.join(batch)})&status=eq.{status_value}"
+        response = timed_request('GET', url, "GET notified", len(batch), headers=HEADERS)
+        response.raise_for_status()
+        rows.extend(response.json())
+    return rows
+
+def process_signals(signals, status_value, totals):
+    """Analyze one batch of signals and apply the decisions in bulk"""
+    decisions = []
+    for signal in signals:
+        decision, reasoning = analyze_signal(signal)
+        
+        if decision != 'PENDING':
+            decisions.append((signal['id'], decision, reasoning))
+        else:
+            totals['pending'] += 1
+            print(f"   ⏸️  Kept as PENDING")
+    
+    print(f"\n📤 Applying {len(decisions)} decisions in bulk...")
+    updated = update_signals(decisions, status_value)
+    totals['approved'] += updated.get("APPROVED", 0)
+    totals['rejected'] += updated.get("REJECTED", 0)
+    totals['total'] += len(signals)
+
+def drain_queue(status_value, totals):
+    """Run every pending signal through the analysis, page by page"""
+    for page_number, signals in enumerate(iter_pending_pages(status_value), 1):
+        print(f"\n📥 Page {page_number}: {len(signals)} pending signals")
+        
+        # Debug: Show first signal structure
+        if page_number == 1 and not totals['total']:
+            print(f"\n🔍 Signal structure (first signal):")
+            print(f"   Columns: {list(signals[0].keys())}")
+        
+        process_signals(signals, status_value, totals)
+
+def insert_latencies_ms(signals):
+    """Milliseconds from each row's created_at (database clock) to now (local clock)"""
+    now = datetime.now(timezone.utc)
+    latencies = []
+    for signal in signals:
+        try:
+            created_at = datetime.fromisoformat(signal['created_at'].replace('Z', '+00:00'))
+        except (KeyError, AttributeError, ValueError):
+            continue
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        latencies.append((now - created_at).total_seconds() * 1000)
+    return latencies
+
+def connect_listener():
+    conn = psycopg2.connect(SUPABASE_DB_URL)
+    conn.set_session(autocommit=True)
+    with conn.cursor() as cursor:
+        cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+    return conn
+
+def run_daemon(sweep_interval=SWEEP_INTERVAL):
+    """
+    Stay connected and LISTEN for inserts: notified signals are analyzed as
+    soon as they arrive. A full sweep of the pending queue runs at start-up,
+    every sweep_interval seconds and after every reconnect, so nothing is
+    lost if a notification is missed.
+    """
+    if psycopg2 is None:
+        print("❌ Error: --daemon needs psycopg2 (pip install -r requirements.txt)")
+        sys.exit(1)
+    if not SUPABASE_DB_URL:
+        print("❌ Error: SUPABASE_DB_URL not set (needed for LISTEN/NOTIFY)")
+        sys.exit(1)
+    if ':6543/' in SUPABASE_DB_URL:
+        print("⚠️  SUPABASE_DB_URL points at the transaction pooler (:6543) - notifications need a session connection")
+    
+    status_value = resolve_status_format()
+    resolve_field_mapping()
+    totals = {"approved": 0, "rejected": 0, "pending": 0, "total": 0}
+    latencies = []
+    reported = 0
+    conn = None
+    backoff = 1
+    next_sweep = time.monotonic()
+    
+    print(f"👂 Listening on '{NOTIFY_CHANNEL}', sweeping every {sweep_interval}s")
+    try:
+        while True:
+            try:
+                if conn is None:
+                    conn = connect_listener()
+                    backoff = 1
+                    next_sweep = time.monotonic()  # catch up on anything missed while disconnected
+                
+                timeout = max(next_sweep - time.monotonic(), 0)
+                if select.select([conn], [], [], timeout)[0]:
+                    conn.poll()
+                    ids = []
+                    while conn.notifies:
+                        ids.append(conn.notifies.pop(0).payload)
+                    signals = fetch_signals_by_id(ids, status_value) if ids else []
+                    if signals:
+                        print(f"\n⚡ {len(signals)} new signal(s) notified")
+                        process_signals(signals, status_value, totals)
+                        batch_latencies = insert_latencies_ms(signals)
+                        latencies.extend(batch_latencies)
+                        if batch_latencies:
+                            print(f"   ⏱️  Insert → decision: avg {sum(batch_latencies) / len(batch_latencies):.0f} ms, "
+                                  f"max {max(batch_latencies):.0f} ms")
+                
+                if time.monotonic() >= next_sweep:
+                    drain_queue(status_value, totals)
+                    next_sweep = time.monotonic() + sweep_interval
+                    # Report and reset per sweep so a long-running worker stays bounded
+                    if totals['total'] != reported:
+                        print_round_trips()
+                        reported = totals['total']
+                    round_trips.clear()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                print(f"⚠️  Listener connection lost: {e} - reconnecting in {backoff}s")
+                conn = None
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+            except requests.RequestException as e:
+                print(f"⚠️  Supabase request failed: {e}")
+                time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping")
+    finally:
+        if conn is not None:
+            conn.close()
+    
+    print_summary(totals)
+    if latencies:
+        ordered = sorted(latencies)
+        print(f"   Insert → decision over {len(ordered)} notified signals: "
+              f"p50 {ordered[len(ordered) // 2]:.0f} ms, p95 {ordered[int(len(ordered) * 0.95)]:.0f} ms, "
+              f"max {ordered[-1]:.0f} ms")
+
+def print_summary(totals):
+    print("\n" + "="*60)
+    print(f"✅ Analysis complete")
+    print(f"   Approved: {totals['approved']}")
+    print(f"   Rejected: {totals['rejected']}")
+    print(f"   Pending: {totals['pending']}")
+    print_round_trips()
+    print("="*60)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Analyze pending signals')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running and analyze new signals on insert (LISTEN/NOTIFY via SUPABASE_DB_URL)')
+    parser.add_argument('--sweep-interval', type=float, default=SWEEP_INTERVAL,
+                        help='Seconds between full pending-queue sweeps in daemon mode')
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    
     print("="*60)
     print("🤖 KLARPAKKE AUTOMATED ANALYSIS")
     print("="*60)
     
+    if args.daemon:
+        run_daemon(args.sweep_interval)
+        return
+    
     try:
-        signals, status_format = fetch_pending_signals()
-        print(f"\n📥 Found {len(signals)} pending signals")
+        status_value = resolve_status_format()
+        resolve_field_mapping()
+        totals = {"approved": 0, "rejected": 0, "pending": 0, "total": 0}
+        drain_queue(status_value, totals)
         
-        if not signals:
+        print(f"\n📥 Processed {totals['total']} pending signals")
+        if not totals['total']:
             print("✅ No pending signals to analyze")
+            print_round_trips()
             return
         
-        # Debug: Show first signal structure
-        if len(signals) > 0:
-            print(f"\n🔍 Signal structure (first signal):")
-            print(f"   Columns: {list(signals[0].keys())}")
-        
-        approved_count = 0
-        rejected_count = 0
-        pending_count = 0
-        
-        for signal in signals:
-            decision, reasoning = analyze_signal(signal)
-            
-            if decision != 'PENDING':
-                if update_signal(signal['id'], decision, reasoning, status_format):
-                    print(f"   ✅ Updated to {decision}")
-                    if decision == "APPROVED":
-                        approved_count += 1
-                    elif decision == "REJECTED":
-                        rejected_count += 1
-                else:
-                    print(f"   ❌ Failed to update")
-            else:
-                pending_count += 1
-                print(f"   ⏸️  Kept as PENDING")
-        
-        print("\n" + "="*60)
-        print(f"✅ Analysis complete")
-        print(f"   Approved: {approved_count}")
-        print(f"   Rejected: {rejected_count}")
-        print(f"   Pending: {pending_count}")
-        print("="*60)
+        print_summary(totals)
         
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -5,37 +5,121 @@ Backtest trading strategy against historical data
 import os
 import sys
 import json
+import time
 import argparse
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+import backtest_data
+from backtest_engine import (DEFAULT_COSTS, apply_costs, columns_from_pages, compute_metrics, monte_carlo,
+                             replay_signals, run_sweep, select, walk_forward)
+from backtest_portfolio import simulate_portfolio
 
 print("="*70)
 print("📊 KLARPAKKE BACKTEST FRAMEWORK")
 print("="*70)
 print()
 
+def parse_range(value: str) -> List[float]:
+    """
+    Parse START:STOP:STEP (inclusive) or a comma-separated list into floats
+    """
+    if ':' not in value:
+        return [float(v) for v in value.split(',') if v.strip()]
+    start, stop, step = (float(v) for v in value.split(':'))
+    if step <= 0:
+        raise argparse.ArgumentTypeError(f"step must be positive: {value}")
+    count = int(round((stop - start) / step)) + 1
+    return [round(start + i * step, 10) for i in range(max(count, 0))]
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Backtest trading strategy')
-    parser.add_argument('--strategy', required=True, choices=['conservative', 'moderate', 'aggressive'])
-    parser.add_argument('--min-confidence', type=float, required=True)
-    parser.add_argument('--max-risk', type=float, required=True)
+    parser.add_argument('--strategy', choices=['conservative', 'moderate', 'aggressive'])
+    parser.add_argument('--min-confidence', type=float)
+    parser.add_argument('--max-risk', type=float)
     parser.add_argument('--start-date', required=True)
     parser.add_argument('--end-date', required=True)
     parser.add_argument('--output', required=True)
     parser.add_argument('--initial-capital', type=float, default=10000.0)
-    return parser.parse_args()
+    parser.add_argument('--snapshot', help='Read history from a local snapshot (scripts/export-signal-snapshot.py) instead of Supabase')
+    parser.add_argument('--candles', help='Replay entry/SL/TP against OHLCV candles in this directory (scripts/import-candles.py)')
+    parser.add_argument('--max-hold-bars', type=int, default=10080,
+                        help='Close replayed trades at market after this many bars (default: one week of 1m bars)')
+    parser.add_argument('--sweep', action='store_true',
+                        help='Grid search over --min-confidence-range x --max-risk-range')
+    parser.add_argument('--min-confidence-range', type=parse_range, default='0.60:0.95:0.05',
+                        help='START:STOP:STEP or comma list (sweep mode)')
+    parser.add_argument('--max-risk-range', type=parse_range, default='0.25:2.0:0.25',
+                        help='START:STOP:STEP or comma list (sweep mode)')
+    parser.add_argument('--workers', type=int, default=None, help='Process pool size (sweep mode)')
+    parser.add_argument('--walk-forward', action='store_true',
+                        help='Re-select min confidence per train window from --min-confidence-range, trade the next test window')
+    parser.add_argument('--train-days', type=int, default=30, help='Train window length (walk-forward mode)')
+    parser.add_argument('--test-days', type=int, default=7, help='Test window length and step (walk-forward mode)')
+    parser.add_argument('--min-train-trades', type=int, default=5,
+                        help='Skip candidates with fewer trades in the train window (walk-forward mode)')
+    parser.add_argument('--costs', action='store_true', help='Apply fees/slippage and report gross vs net')
+    parser.add_argument('--maker-fee', type=float, default=DEFAULT_COSTS['maker_fee_percent'], help='Maker fee %% per side')
+    parser.add_argument('--taker-fee', type=float, default=DEFAULT_COSTS['taker_fee_percent'], help='Taker fee %% per side')
+    parser.add_argument('--slippage-bps', type=float, default=DEFAULT_COSTS['slippage_bps'], help='Fixed slippage per side (bps)')
+    parser.add_argument('--impact', type=float, default=DEFAULT_COSTS['impact_coefficient'],
+                        help='Extra slippage per unit of order notional / fill-bar notional volume')
+    parser.add_argument('--delay-bars', type=int, default=0,
+                        help='Execution latency: fill at the open this many bars after the signal (needs --candles)')
+    parser.add_argument('--monte-carlo', type=int, default=0, metavar='N',
+                        help='Resample the filtered trade sequence N times for drawdown/ruin percentiles')
+    parser.add_argument('--mc-method', choices=['bootstrap', 'permute'], default='bootstrap')
+    parser.add_argument('--mc-seed', type=int, default=None)
+    parser.add_argument('--ruin-percent', type=float, default=50.0,
+                        help='Equity loss (%% of initial capital) that counts as ruin')
+    parser.add_argument('--portfolio', action='store_true',
+                        help='Simulate overlapping positions under the risk engine limits (max positions, daily/weekly stops)')
+    parser.add_argument('--hold-hours', type=float, default=24.0,
+                        help='Assumed holding time for signals without an exit time (portfolio mode)')
+    args = parser.parse_args()
+    if args.sweep and args.walk_forward:
+        parser.error("--sweep and --walk-forward are mutually exclusive")
+    if args.walk_forward and args.max_risk is None:
+        parser.error("--walk-forward requires --max-risk")
+    if not (args.sweep or args.walk_forward):
+        missing = [flag for flag, value in (('--strategy', args.strategy),
+                                            ('--min-confidence', args.min_confidence),
+                                            ('--max-risk', args.max_risk)) if value is None]
+        if missing:
+            parser.error(f"the following arguments are required: {', '.join(missing)}")
+    return args
 
-def fetch_historical_signals(start_date: str, end_date: str) -> List[Dict]:
+def fetch_historical_signals(start_date: str, end_date: str) -> Iterator[List[Dict]]:
     """
-    Fetch historical signals from Supabase
-    In real implementation, this would query the database
+    Fetch closed historical signals from Supabase, one page at a time
+    Falls back to mock data when SUPABASE_SERVICE_ROLE_KEY is not set
     """
-    # TODO: Implement real Supabase query
-    # For now, return mock data
     print(f"💾 Fetching signals from {start_date} to {end_date}...")
     
+    if not backtest_data.has_credentials():
+        print("  ⚠️  SUPABASE_SERVICE_ROLE_KEY not set - using mock signals")
+        yield mock_signals(start_date, end_date)
+        return
+    
+    total = 0
+    pages = 0
+    for page in backtest_data.stream_signal_pages(start_date, end_date):
+        total += len(page)
+        pages += 1
+        yield page
+    print(f"  ✅ Fetched {total} historical signals in {pages} pages")
+
+def mock_signals(start_date: str, end_date: str) -> List[Dict]:
+    """
+    Synthesize 100 trades, spread evenly over the window, for local runs without database access
+    """
+    start = datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc)
+    spacing = (datetime.fromisoformat(end_date).replace(tzinfo=timezone.utc) + timedelta(days=1) - start) / 100
+    
     # Mock signals for demonstration
-    mock_signals = [
+    templates = [
         {
             "id": 1,
             "symbol": "BTCUSDT",
@@ -80,8 +164,9 @@ def fetch_historical_signals(start_date: str, end_date: str) -> List[Dict]:
     # Generate more mock signals (simulate 100 trades)
     all_signals = []
     for i in range(100):
-        base_signal = mock_signals[i % len(mock_signals)].copy()
+        base_signal = templates[i % len(templates)].copy()
         base_signal['id'] = i + 1
+        base_signal['created_at'] = (start + spacing * i).isoformat()
         base_signal['confidence'] = 0.65 + (i % 30) / 100  # Vary confidence
         
         # 65% winrate simulation
@@ -96,80 +181,228 @@ def fetch_historical_signals(start_date: str, end_date: str) -> List[Dict]:
         
         all_signals.append(base_signal)
     
-    print(f"  ✅ Fetched {len(all_signals)} historical signals")
+    print(f"  ✅ Generated {len(all_signals)} mock signals")
     return all_signals
 
-def apply_strategy_filter(signals: List[Dict], min_confidence: float) -> List[Dict]:
+def load_signals(start_date: str, end_date: str, snapshot: str = None) -> Dict[str, np.ndarray]:
+    """
+    Stream the history straight into engine columns, or memory-map a local snapshot
+    """
+    if snapshot:
+        started = time.perf_counter()
+        columns = backtest_data.load_snapshot(snapshot, start_date, end_date)
+        print(f"🗄️  Loaded {len(columns['confidence'])} signals from snapshot {snapshot} "
+              f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return columns
+    return columns_from_pages(fetch_historical_signals(start_date, end_date))
+
+def cost_model(args) -> Dict:
+    """
+    Cost parameters from the CLI, or None when --costs is off
+    """
+    if not args.costs:
+        return None
+    return {
+        **DEFAULT_COSTS,
+        "maker_fee_percent": args.maker_fee,
+        "taker_fee_percent": args.taker_fee,
+        "slippage_bps": args.slippage_bps,
+        "impact_coefficient": args.impact,
+        "delay_bars": args.delay_bars,
+    }
+
+def prepare_signals(args, price_costs: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Load the history; with --candles recompute outcomes from price action,
+    with --costs turn gross R into net R at --max-risk
+    """
+    columns = load_signals(args.start_date, args.end_date, args.snapshot)
+    if args.delay_bars and not args.candles:
+        print("  ⚠️  --delay-bars needs --candles; ignoring execution delay")
+    
+    if args.candles:
+        started = time.perf_counter()
+        candles = backtest_data.load_candles(args.candles, np.unique(columns['symbol']))
+        replayed = replay_signals(columns, candles, args.max_hold_bars, args.delay_bars)
+        print(f"🕯️  Replayed {len(replayed['confidence'])}/{len(columns['confidence'])} signals "
+              f"against {len(candles)} symbols' candles in {(time.perf_counter() - started) * 1000:.1f} ms")
+        columns = replayed
+    
+    costs = cost_model(args)
+    if costs and price_costs:
+        columns = apply_costs(columns, costs, args.initial_capital, args.max_risk)
+        print(f"💸 Costs: maker {costs['maker_fee_percent']}% / taker {costs['taker_fee_percent']}%, "
+              f"slippage {costs['slippage_bps']} bps + impact x{costs['impact_coefficient']}")
+    return columns
+
+def apply_strategy_filter(columns: Dict[str, np.ndarray], min_confidence: float) -> Dict[str, np.ndarray]:
     """
     Filter signals based on strategy parameters
     """
-    filtered = [s for s in signals if s['confidence'] >= min_confidence]
-    print(f"🔍 Filtered to {len(filtered)} signals (min confidence: {min_confidence})")
+    filtered = select(columns, columns['confidence'] >= min_confidence)
+    print(f"🔍 Filtered to {len(filtered['confidence'])} signals (min confidence: {min_confidence})")
     return filtered
 
-def calculate_metrics(signals: List[Dict], initial_capital: float, max_risk_percent: float) -> Dict:
+def calculate_metrics(columns: Dict[str, np.ndarray], initial_capital: float, max_risk_percent: float) -> Dict:
     """
     Calculate backtest performance metrics
+    Delegates to the vectorized engine (equity = initial * cumprod(1 + risk * r))
+    """
+    return compute_metrics(columns, initial_capital, max_risk_percent)
+
+def save_json(path: str, result: Dict) -> None:
+    """
+    Save results - handle both filename and path
     """
-    if not signals:
-        return {
-            "error": "No signals match strategy criteria",
-            "total_trades": 0
-        }
+    output_dir = os.path.dirname(path)
+    if output_dir:  # Only create dir if path contains directory
+        os.makedirs(output_dir, exist_ok=True)
     
-    total_trades = len(signals)
-    wins = len([s for s in signals if s['outcome'] == 'win'])
-    losses = total_trades - wins
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+
+def main_sweep(args):
+    """
+    Load history once, evaluate the full parameter grid, write one combined file
+    """
+    strategy = args.strategy or 'sweep'
+    confidences = args.min_confidence_range
+    risks = args.max_risk_range
     
-    winrate = wins / total_trades if total_trades > 0 else 0
+    print(f"🧮 Sweep: {len(confidences)} confidence x {len(risks)} risk = {len(confidences) * len(risks)} runs")
+    print(f"   Period: {args.start_date} → {args.end_date}")
+    print(f"   Initial Capital: ${args.initial_capital:,.2f}")
+    print()
     
-    # Calculate R-multiples
-    r_multiples = [s['r_multiple'] for s in signals]
-    avg_r = sum(r_multiples) / len(r_multiples) if r_multiples else 0
+    # Costs depend on the risk level, so each sweep cell prices its own
+    columns = prepare_signals(args, price_costs=False)
     
-    # Calculate profit/loss
-    total_profit_percent = sum([s['profit_percent'] for s in signals])
+    started = time.perf_counter()
+    cells = run_sweep(columns, confidences, risks, args.initial_capital, args.workers, cost_model(args))
+    elapsed = time.perf_counter() - started
     
-    # Simulate position sizing (1% risk per trade)
-    capital = initial_capital
-    equity_curve = [capital]
-    max_capital = capital
-    max_drawdown = 0
+    timestamp = datetime.now(timezone.utc).isoformat()
+    results = []
+    for cell in cells:
+        results.append({
+            "strategy": f"{strategy} c={cell['min_confidence']:g} r={cell['max_risk_percent']:g}%",
+            "parameters": {
+                "min_confidence": cell['min_confidence'],
+                "max_risk_percent": cell['max_risk_percent'],
+                "start_date": args.start_date,
+                "end_date": args.end_date,
+                "initial_capital": args.initial_capital
+            },
+            "timestamp": timestamp,
+            "metrics": cell['metrics']
+        })
     
-    for signal in signals:
-        risk_amount = capital * (max_risk_percent / 100)
-        profit_loss = risk_amount * signal['r_multiple']
-        capital += profit_loss
-        equity_curve.append(capital)
-        
-        if capital > max_capital:
-            max_capital = capital
-        
-        drawdown = ((max_capital - capital) / max_capital) * 100 if max_capital > 0 else 0
-        if drawdown > max_drawdown:
-            max_drawdown = drawdown
+    save_json(args.output, {
+        "strategy": strategy,
+        "mode": "sweep",
+        "parameters": {
+            "min_confidence_range": confidences,
+            "max_risk_range": risks,
+            "start_date": args.start_date,
+            "end_date": args.end_date,
+            "initial_capital": args.initial_capital
+        },
+        "timestamp": timestamp,
+        "costs": cost_model(args),
+        "results": results
+    })
     
-    final_capital = equity_curve[-1]
-    total_profit = final_capital - initial_capital
-    total_profit_percent = (total_profit / initial_capital) * 100
+    best = max((r for r in results if r['metrics'].get('total_trades')),
+               key=lambda r: r['metrics']['total_profit_percent'], default=None)
     
-    return {
-        "total_trades": total_trades,
-        "wins": wins,
-        "losses": losses,
-        "winrate": round(winrate, 4),
-        "avg_r_multiple": round(avg_r, 2),
-        "initial_capital": initial_capital,
-        "final_capital": round(final_capital, 2),
-        "total_profit": round(total_profit, 2),
-        "total_profit_percent": round(total_profit_percent, 2),
-        "max_drawdown_percent": round(max_drawdown, 2),
-        "equity_curve": [round(e, 2) for e in equity_curve]
-    }
+    print()
+    print("="*70)
+    print("✅ SWEEP COMPLETE")
+    print("="*70)
+    print()
+    print(f"⏱️  Evaluated {len(results)} combinations in {elapsed:.2f}s")
+    if best:
+        print(f"🏆 Best: {best['strategy']} → {best['metrics']['total_profit_percent']:+.2f}% "
+              f"(max DD {best['metrics']['max_drawdown_percent']}%)")
+    print()
+    print(f"💾 Results saved to: {args.output}")
+    print()
+
+def main_walk_forward(args):
+    """
+    Rolling train/test evaluation with a stitched out-of-sample equity curve
+    """
+    strategy = args.strategy or 'walk-forward'
+    
+    print(f"🚶 Walk-forward: {args.train_days}d train → {args.test_days}d test")
+    print(f"   Candidates: {args.min_confidence_range}")
+    print(f"   Max Risk: {args.max_risk}%")
+    print(f"   Period: {args.start_date} → {args.end_date}")
+    print()
+    
+    columns = prepare_signals(args)
+    
+    started = time.perf_counter()
+    result = walk_forward(columns, args.min_confidence_range, args.max_risk, args.initial_capital,
+                          args.train_days, args.test_days, args.min_train_trades)
+    elapsed = time.perf_counter() - started
+    windows = result['windows']
+    metrics = result['metrics']
+    
+    save_json(args.output, {
+        "strategy": strategy,
+        "mode": "walk-forward",
+        "parameters": {
+            "min_confidence": "per-window",
+            "min_confidence_range": args.min_confidence_range,
+            "max_risk_percent": args.max_risk,
+            "train_days": args.train_days,
+            "test_days": args.test_days,
+            "start_date": args.start_date,
+            "end_date": args.end_date,
+            "initial_capital": args.initial_capital
+        },
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "costs": cost_model(args),
+        "windows": windows,
+        "metrics": metrics
+    })
+    
+    print()
+    print("| Test window | Min conf | Train ret | Trades | Winrate | Profit | Max DD |")
+    print("|-------------|----------|-----------|--------|---------|--------|--------|")
+    for w in windows:
+        test = w['test']
+        if not test.get('total_trades'):
+            print(f"| {w['test_start']} | {w['min_confidence'] or '-'} | - | 0 | - | - | - |")
+            continue
+        print(f"| {w['test_start']} | {w['min_confidence']} | {w['train_return_percent']:+.2f}% | "
+              f"{test['total_trades']} | {test['winrate']*100:.1f}% | "
+              f"{test['total_profit_percent']:+.2f}% | {test['max_drawdown_percent']}% |")
+    
+    print()
+    print("="*70)
+    print("✅ WALK-FORWARD COMPLETE")
+    print("="*70)
+    print()
+    print(f"⏱️  {len(windows)} windows in {elapsed * 1000:.1f} ms")
+    if metrics.get('total_trades'):
+        print(f"📊 Out-of-sample: {metrics['total_trades']} trades, "
+              f"{metrics['total_profit_percent']:+.2f}% (max DD {metrics['max_drawdown_percent']}%)")
+    print()
+    print(f"💾 Results saved to: {args.output}")
+    print()
 
 def main():
     args = parse_args()
     
+    if args.sweep:
+        main_sweep(args)
+        return
+    if args.walk_forward:
+        main_walk_forward(args)
+        return
+    
     print(f"🎯 Strategy: {args.strategy.upper()}")
     print(f"   Min Confidence: {args.min_confidence}")
     print(f"   Max Risk: {args.max_risk}%")
@@ -178,7 +411,7 @@ def main():
     print()
     
     # Fetch historical signals
-    signals = fetch_historical_signals(args.start_date, args.end_date)
+    signals = prepare_signals(args)
     
     # Apply strategy filter
     filtered_signals = apply_strategy_filter(signals, args.min_confidence)
@@ -199,16 +432,25 @@ def main():
             "initial_capital": args.initial_capital
         },
         "timestamp": datetime.now(timezone.utc).isoformat(),
+        "costs": cost_model(args),
         "metrics": metrics
     }
     
-    # Save results - handle both filename and path
-    output_dir = os.path.dirname(args.output)
-    if output_dir:  # Only create dir if path contains directory
-        os.makedirs(output_dir, exist_ok=True)
+    if args.monte_carlo:
+        print(f"🎲 Monte Carlo: {args.monte_carlo} {args.mc_method} paths...")
+        started = time.perf_counter()
+        result['monte_carlo'] = monte_carlo(filtered_signals['r_multiple'], args.initial_capital, args.max_risk,
+                                            args.monte_carlo, args.mc_method, args.ruin_percent, args.mc_seed)
+        print(f"   Done in {time.perf_counter() - started:.2f}s")
     
-    with open(args.output, 'w') as f:
-        json.dump(result, f, indent=2)
+    if args.portfolio:
+        print("🧺 Portfolio simulation under risk engine limits...")
+        started = time.perf_counter()
+        result['portfolio'] = simulate_portfolio(filtered_signals, args.initial_capital, args.max_risk,
+                                                 default_hold_ms=int(args.hold_hours * 3600 * 1000))
+        print(f"   Done in {(time.perf_counter() - started) * 1000:.1f} ms")
+    
+    save_json(args.output, result)
     
     print()
     print("="*70)
@@ -217,12 +459,41 @@ def main():
     print()
     print(f"📊 Results:")
     print(f"   Total Trades: {metrics['total_trades']}")
-    print(f"   Wins: {metrics['wins']} | Losses: {metrics['losses']}")
-    print(f"   Winrate: {metrics['winrate']*100:.1f}%")
-    print(f"   Avg R-Multiple: {metrics['avg_r_multiple']}x")
-    print(f"   Max Drawdown: {metrics['max_drawdown_percent']}%")
-    print(f"   Final Capital: ${metrics['final_capital']:,.2f}")
-    print(f"   Total Profit: ${metrics['total_profit']:,.2f} ({metrics['total_profit_percent']:+.2f}%)")
+    if 'error' in metrics:
+        print(f"   ⚠️  {metrics['error']}")
+    else:
+        print(f"   Wins: {metrics['wins']} | Losses: {metrics['losses']}")
+        print(f"   Winrate: {metrics['winrate']*100:.1f}%")
+        print(f"   Avg R-Multiple: {metrics['avg_r_multiple']}x")
+        print(f"   Max Drawdown: {metrics['max_drawdown_percent']}%")
+        print(f"   Final Capital: ${metrics['final_capital']:,.2f}")
+        print(f"   Total Profit: ${metrics['total_profit']:,.2f} ({metrics['total_profit_percent']:+.2f}%)")
+        if 'gross' in metrics:
+            gross = metrics['gross']
+            print(f"   Gross Profit: {gross['total_profit_percent']:+.2f}% (costs: -{metrics['cost_drag_percent']:.2f}%)")
+            print(f"   Gross Winrate: {gross['winrate']*100:.1f}% | Gross Avg R: {gross['avg_r_multiple']}x")
+    mc = result.get('monte_carlo')
+    if mc and mc.get('simulations'):
+        dd = mc['max_drawdown_percent']
+        final = mc['final_capital']
+        print()
+        print(f"🎲 Monte Carlo ({mc['simulations']} {mc['method']} paths):")
+        print(f"   Max Drawdown P5/P50/P95: {dd['p5']}% / {dd['p50']}% / {dd['p95']}%")
+        print(f"   Final Capital P5/P50/P95: ${final['p5']:,.2f} / ${final['p50']:,.2f} / ${final['p95']:,.2f}")
+        print(f"   Risk of Ruin (-{mc['ruin_percent']:g}%): {mc['risk_of_ruin']*100:.2f}%")
+    portfolio = result.get('portfolio')
+    if portfolio:
+        pm = portfolio['metrics']
+        print()
+        print(f"🧺 Portfolio ({portfolio['effective_risk_percent']:g}% risk/trade, "
+              f"max {portfolio['limits']['max_positions']} positions):")
+        if pm.get('total_trades'):
+            print(f"   Taken: {pm['total_trades']} | Blocked: {portfolio['blocked_count']} "
+                  f"| Kill switches: {portfolio['kill_switches']}")
+            print(f"   Total Profit: ${pm['total_profit']:,.2f} ({pm['total_profit_percent']:+.2f}%) "
+                  f"| Max Drawdown: {pm['max_drawdown_percent']}%")
+        for reason, count in sorted(portfolio['blocked_by_reason'].items()):
+            print(f"   Blocked {reason}: {count}")
     print()
     print(f"💾 Results saved to: {args.output}")
     print()
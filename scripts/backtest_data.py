@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Historical signal loading for backtests - streamed Supabase reads and local mmap snapshots
+"""
+import os
+import json
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from backtest_engine import COLUMNS, epoch_ms, to_columns
+from postgrest_client import SUPABASE_SERVICE_ROLE_KEY, PostgrestClient
+
+PAGE_SIZE = int(os.environ.get('BACKTEST_PAGE_SIZE', '1000'))
+REQUEST_TIMEOUT = 30
+
+# Only what the engine needs - never select(*) the reasoning text
+BACKTEST_COLUMNS = ("id,created_at,closed_at,symbol,pair,direction,signal_type,entry_price,stop_loss,take_profit,"
+                    "confidence,confidence_score,outcome,profit_percent,r_multiple")
+CLOSED_STATUSES = "(closed,CLOSED,Closed)"
+
+
+def has_credentials() -> bool:
+    return bool(SUPABASE_SERVICE_ROLE_KEY)
+
+
+def _end_exclusive(end_date: str) -> str:
+    """
+    --end-date is inclusive; PostgREST gets the following midnight as an upper bound
+    """
+    return (date.fromisoformat(end_date) + timedelta(days=1)).isoformat()
+
+
+def normalize_row(row: Dict) -> Dict:
+    """
+    Fold schema variants (symbol/pair, confidence/confidence_score) into engine fields
+    """
+    confidence = row.get('confidence')
+    if confidence is None and row.get('confidence_score') is not None:
+        confidence = row['confidence_score'] / 100
+    r_multiple = float(row.get('r_multiple') or 0.0)
+    outcome = row.get('outcome') or ('win' if r_multiple > 0 else 'loss')
+    return {
+        "id": row.get('id'),
+        "created_at": row.get('created_at'),
+        "closed_at": row.get('closed_at'),
+        "symbol": row.get('symbol') or row.get('pair'),
+        "direction": row.get('direction') or row.get('signal_type'),
+        "entry_price": row.get('entry_price'),
+        "stop_loss": row.get('stop_loss'),
+        "take_profit": row.get('take_profit'),
+        "confidence": float(confidence or 0.0),
+        "outcome": outcome.lower(),
+        "profit_percent": float(row.get('profit_percent') or 0.0),
+        "r_multiple": r_multiple,
+    }
+
+
+def stream_signal_pages(start_date: str, end_date: str, page_size: int = PAGE_SIZE,
+                        client: Optional[PostgrestClient] = None,
+                        after: Optional[Tuple[str, object]] = None, key: str = 'created_at',
+                        created_from: Optional[str] = None) -> Iterator[List[Dict]]:
+    """
+    Yield closed signals in pages ordered by (key, id), key being created_at
+    or closed_at; the date window applies to the same column.
+    Keyset pagination keeps every page an index range scan, however deep
+    into the history we are, and only one page is held in memory at a time.
+    `after` resumes strictly after a (key, id) cursor; an id of None means
+    strictly after the timestamp alone.
+    """
+    client = client or PostgrestClient()
+    base_params = [
+        ("select", BACKTEST_COLUMNS),
+        ("status", f"in.{CLOSED_STATUSES}"),
+        (key, f"gte.{start_date}"),
+        (key, f"lt.{_end_exclusive(end_date)}"),
+        ("order", f"{key}.asc,id.asc"),
+        ("limit", str(page_size)),
+    ]
+    if created_from and key != 'created_at':
+        base_params.append(("created_at", f"gte.{created_from}"))
+    cursor = after
+    while True:
+        params = list(base_params)
+        if cursor:
+            at, row_id = cursor
+            if row_id is None:
+                params.append((key, f'gt.{at}'))
+            else:
+                params.append(("or", f'({key}.gt."{at}",and({key}.eq."{at}",id.gt.{row_id}))'))
+        response = client.get("aisignal", params=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        rows = response.json()
+        if not rows:
+            return
+        yield [normalize_row(r) for r in rows]
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1][key], rows[-1]['id'])
+
+
+# --- Local columnar snapshot -------------------------------------------------
+#
+# <root>/manifest.json                        cursors + partition list
+# <root>/<YYYY-MM>/<SYMBOL>/<column>.npy      one flat array per engine column
+#
+# Partitions are plain .npy files so readers can np.load(mmap_mode='r') them.
+# The symbol lives in the partition path rather than in a column, and each
+# partition is kept sorted by created_at. id.npy holds the row ids (as text)
+# so a re-fetched row is never appended twice; the engine does not read it.
+#
+# The first export walks created_at; once it has completed, refreshes walk
+# closed_at, so a signal created before an export that closes after it is
+# still picked up.
+
+SNAPSHOT_COLUMNS = {name: dtype for name, dtype in COLUMNS.items() if name != 'symbol'}
+MANIFEST = "manifest.json"
+ID_FILE = "id.npy"
+
+
+def _symbol_key(symbol: Optional[str]) -> str:
+    return (symbol or 'UNKNOWN').upper().replace('/', '-')
+
+
+def _partition_key(row: Dict) -> Tuple[str, str]:
+    return row['created_at'][:7], _symbol_key(row.get('symbol'))
+
+
+def read_manifest(root: str) -> Dict:
+    try:
+        with open(os.path.join(root, MANIFEST), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"cursor": None, "closed_cursor": None, "complete": False, "rows": 0, "partitions": []}
+
+
+def _write_manifest(root: str, manifest: Dict) -> None:
+    path = os.path.join(root, MANIFEST)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def _append_partition(root: str, month: str, symbol: str, rows: List[Dict]) -> int:
+    """Merge rows into one partition, skipping ids it already holds. Returns rows added."""
+    directory = os.path.join(root, month, symbol)
+    os.makedirs(directory, exist_ok=True)
+    id_path = os.path.join(directory, ID_FILE)
+    stored = 0
+    if os.path.exists(os.path.join(directory, "created_at.npy")):
+        stored = len(np.load(os.path.join(directory, "created_at.npy"), mmap_mode='r'))
+    # Partitions written before ids were kept get blank ids: unknown, never matched
+    old_ids = np.load(id_path) if os.path.exists(id_path) else np.full(stored, '')
+    seen = set(old_ids.tolist())
+    fresh_rows = []
+    for row in rows:
+        row_id = str(row['id'])
+        if row_id not in seen:
+            seen.add(row_id)
+            fresh_rows.append(row)
+    if not fresh_rows:
+        return 0
+    fresh = to_columns(fresh_rows)
+    fresh_ids = np.array([str(row['id']) for row in fresh_rows])
+    merged = {}
+    for name in SNAPSHOT_COLUMNS:
+        path = os.path.join(directory, f"{name}.npy")
+        merged[name] = np.concatenate([np.load(path), fresh[name]]) if os.path.exists(path) else fresh[name]
+    merged_ids = np.concatenate([old_ids, fresh_ids]) if len(old_ids) else fresh_ids
+    # Late-closing signals arrive out of created_at order
+    order = np.argsort(merged['created_at'], kind='stable')
+    files = {f"{name}.npy": values for name, values in merged.items()}
+    files[ID_FILE] = merged_ids
+    for filename, values in files.items():
+        path = os.path.join(directory, filename)
+        with open(f"{path}.tmp", 'wb') as f:
+            np.save(f, values[order])
+        os.replace(f"{path}.tmp", path)
+    return len(fresh_rows)
+
+
+def _timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _later_close(cursor: Optional[List], row: Dict) -> Optional[List]:
+    """
+    (closed_at, id) of whichever is later. Timestamps compare at full
+    precision and ids in their own type (bigint or uuid text), as
+    PostgREST orders them; a None id sorts before every id.
+    """
+    if not row.get('closed_at'):
+        return cursor
+    if cursor:
+        at, closed = _timestamp(cursor[0]), _timestamp(row['closed_at'])
+        if closed < at or (closed == at and cursor[1] is not None and row['id'] <= cursor[1]):
+            return cursor
+    return [row['closed_at'], row['id']]
+
+
+def write_snapshot(root: str, pages: Iterable[List[Dict]], key: str = 'created_at') -> Dict:
+    """
+    Append streamed signal pages (ordered by key) to the snapshot, one
+    partition write per (month, symbol) per page. Returns the updated manifest.
+    """
+    os.makedirs(root, exist_ok=True)
+    manifest = read_manifest(root)
+    partitions = set(tuple(p) for p in manifest['partitions'])
+    added = 0
+    for page in pages:
+        groups: Dict[Tuple[str, str], List[Dict]] = {}
+        for row in page:
+            groups.setdefault(_partition_key(row), []).append(row)
+        appended = 0
+        for (month, symbol), rows in groups.items():
+            appended += _append_partition(root, month, symbol, rows)
+            partitions.add((month, symbol))
+        added += appended
+        if key == 'created_at':
+            manifest['cursor'] = [page[-1]['created_at'], page[-1]['id']]
+        for row in page:
+            manifest['closed_cursor'] = _later_close(manifest.get('closed_cursor'), row)
+        manifest['rows'] += appended
+        manifest['partitions'] = sorted(list(p) for p in partitions)
+        # Persist after every page so an interrupted export resumes cleanly
+        _write_manifest(root, manifest)
+    manifest['added'] = added
+    return manifest
+
+
+def refresh_snapshot(root: str, start_date: str, end_date: Optional[str] = None) -> Dict:
+    """
+    Finish (or start) the created_at export from start_date, then pull only
+    rows closed after the snapshot's closed_at cursor
+    """
+    manifest = read_manifest(root)
+    end_date = end_date or datetime.now(timezone.utc).date().isoformat()
+    if 'complete' not in manifest and manifest['cursor']:
+        # Manifest from before closed_at refreshes: everything closed since its last write is new
+        written = datetime.fromtimestamp(os.path.getmtime(os.path.join(root, MANIFEST)), timezone.utc)
+        manifest.update(complete=True, start_date=start_date, closed_cursor=[written.isoformat(), None])
+        _write_manifest(root, manifest)
+
+    if not manifest.get('complete'):
+        cursor = tuple(manifest['cursor']) if manifest['cursor'] else None
+        if not cursor:
+            os.makedirs(root, exist_ok=True)
+            manifest['start_date'] = start_date
+            _write_manifest(root, manifest)
+        export_from = cursor[0][:10] if cursor else start_date
+        manifest = write_snapshot(root, stream_signal_pages(export_from, end_date, after=cursor))
+        manifest['complete'] = True
+        _write_manifest(root, {k: v for k, v in manifest.items() if k != 'added'})
+        return manifest
+
+    # Signals closed without a closed_at are only seen by the created_at export
+    closed = manifest.get('closed_cursor')
+    since = manifest.get('start_date', start_date)
+    pages = stream_signal_pages(closed[0][:10] if closed else since, end_date,
+                                after=tuple(closed) if closed else None, key='closed_at', created_from=since)
+    return write_snapshot(root, pages, key='closed_at')
+
+
+def load_snapshot(root: str, start_date: str, end_date: str,
+                  symbols: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """
+    Memory-map the partitions overlapping the window and return engine columns,
+    in chronological order
+    """
+    manifest = read_manifest(root)
+    lo = epoch_ms(f"{start_date}T00:00:00+00:00")
+    hi = epoch_ms(f"{_end_exclusive(end_date)}T00:00:00+00:00")
+    wanted = {_symbol_key(s) for s in symbols} if symbols else None
+
+    chunks = {name: [] for name in COLUMNS}
+    for month, symbol in manifest['partitions']:
+        if month < start_date[:7] or month > end_date[:7]:
+            continue
+        if wanted is not None and symbol not in wanted:
+            continue
+        directory = os.path.join(root, month, symbol)
+        mapped = {}
+        for name in SNAPSHOT_COLUMNS:
+            path = os.path.join(directory, f"{name}.npy")
+            if os.path.exists(path):
+                mapped[name] = np.load(path, mmap_mode='r')
+        ts = mapped['created_at']
+        # Snapshots written before a column existed get its neutral value
+        for name, dtype in SNAPSHOT_COLUMNS.items():
+            if name not in mapped:
+                mapped[name] = np.full(len(ts), np.nan if dtype is np.float64 else 0, dtype=dtype)
+        mapped['symbol'] = np.full(len(ts), symbol)
+        # Full months inside the window need no row filter
+        if ts[0] >= lo and ts[-1] < hi:
+            rows = slice(None)
+        else:
+            rows = (ts >= lo) & (ts < hi)
+        for name, values in mapped.items():
+            chunks[name].append(values[rows])
+
+    if not chunks['created_at']:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+    columns = {name: np.concatenate(parts) for name, parts in chunks.items()}
+    order = np.argsort(columns['created_at'], kind='stable')
+    return {name: values[order] for name, values in columns.items()}
+
+
+# --- OHLCV candles -----------------------------------------------------------
+#
+# <root>/<SYMBOL>/{ts,open,high,low,close,volume}.npy   ts = bar open, epoch ms
+
+CANDLE_COLUMNS = ("ts", "open", "high", "low", "close", "volume")
+
+
+def write_candles(root: str, symbol: str, candles: Dict[str, np.ndarray]) -> None:
+    """
+    Store one symbol's candles sorted by bar open time
+    """
+    directory = os.path.join(root, _symbol_key(symbol))
+    os.makedirs(directory, exist_ok=True)
+    order = np.argsort(candles['ts'], kind='stable')
+    for name in CANDLE_COLUMNS:
+        values = np.asarray(candles[name], dtype=np.int64 if name == 'ts' else np.float64)[order]
+        path = os.path.join(directory, f"{name}.npy")
+        with open(f"{path}.tmp", 'wb') as f:
+            np.save(f, values)
+        os.replace(f"{path}.tmp", path)
+
+
+def load_candles(root: str, symbols: Iterable[str]) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Memory-map candles for the given symbols, keyed by the symbol as it
+    appears in the signals. Symbols without candle files are left out.
+    """
+    candles = {}
+    for symbol in set(symbols):
+        directory = os.path.join(root, _symbol_key(symbol))
+        if not os.path.exists(os.path.join(directory, "ts.npy")):
+            continue
+        candles[symbol] = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+                           for name in CANDLE_COLUMNS}
+    return candles
@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+Columnar backtest engine - signals as NumPy arrays, metrics in vectorized passes
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+# Columns the engine works on; everything else in a signal dict is ignored
+COLUMNS = {
+    "created_at": np.int64,  # epoch milliseconds, UTC (0 when unknown)
+    "exit_at": np.int64,  # epoch milliseconds, UTC (0 when unknown)
+    "symbol": np.str_,
+    "direction": np.int8,  # +1 long, -1 short, 0 unknown
+    "entry_price": np.float64,  # NaN when the signal has no price levels
+    "stop_loss": np.float64,
+    "take_profit": np.float64,
+    "confidence": np.float64,
+    "r_multiple": np.float64,
+    "profit_percent": np.float64,
+    "win": np.bool_,
+}
+
+DIRECTIONS = {"LONG": 1, "BUY": 1, "SHORT": -1, "SELL": -1}
+DAY_MS = 86_400_000
+
+
+def epoch_ms(value) -> int:
+    """
+    ISO-8601 timestamp (as returned by PostgREST) to epoch milliseconds
+    """
+    if not value:
+        return 0
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def _price(value) -> float:
+    return float(value) if value is not None else np.nan
+
+
+def to_columns(signals: Iterable[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Load signal dicts into one array per column
+    """
+    signals = list(signals)
+    return {
+        "created_at": np.fromiter((epoch_ms(s.get('created_at')) for s in signals), np.int64, len(signals)),
+        "exit_at": np.fromiter((epoch_ms(s.get('closed_at')) for s in signals), np.int64, len(signals)),
+        "symbol": np.array([s.get('symbol') or '' for s in signals], dtype=np.str_),
+        "direction": np.fromiter((DIRECTIONS.get(str(s.get('direction') or '').upper(), 0) for s in signals),
+                                 np.int8, len(signals)),
+        "entry_price": np.fromiter((_price(s.get('entry_price')) for s in signals), np.float64, len(signals)),
+        "stop_loss": np.fromiter((_price(s.get('stop_loss')) for s in signals), np.float64, len(signals)),
+        "take_profit": np.fromiter((_price(s.get('take_profit')) for s in signals), np.float64, len(signals)),
+        "confidence": np.fromiter((s['confidence'] for s in signals), np.float64, len(signals)),
+        "r_multiple": np.fromiter((s['r_multiple'] for s in signals), np.float64, len(signals)),
+        "profit_percent": np.fromiter((s.get('profit_percent', 0.0) for s in signals), np.float64, len(signals)),
+        "win": np.fromiter((s['outcome'] == 'win' for s in signals), np.bool_, len(signals)),
+    }
+
+
+def columns_from_pages(pages: Iterable[Iterable[Dict]]) -> Dict[str, np.ndarray]:
+    """
+    Build columns from a stream of signal pages, converting each page as it
+    arrives so only one page of dicts is alive at a time
+    """
+    chunks = {name: [] for name in COLUMNS}
+    for page in pages:
+        for name, values in to_columns(page).items():
+            chunks[name].append(values)
+    return {
+        name: np.concatenate(parts) if parts else np.empty(0, dtype=COLUMNS[name])
+        for name, parts in chunks.items()
+    }
+
+
+def select(columns: Dict[str, np.ndarray], mask: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Apply a boolean (or index) mask to every column
+    """
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def equity_curve(r_multiple: np.ndarray, initial_capital: float, max_risk_percent: float) -> np.ndarray:
+    """
+    Compounded equity: initial * cumprod(1 + risk * r), with the starting capital prepended
+    """
+    growth = 1.0 + (max_risk_percent / 100) * r_multiple
+    curve = np.empty(len(r_multiple) + 1, dtype=np.float64)
+    curve[0] = initial_capital
+    np.multiply.accumulate(growth, out=curve[1:])
+    curve[1:] *= initial_capital
+    return curve
+
+
+def max_drawdown_percent(curve: np.ndarray) -> float:
+    """
+    Largest peak-to-trough drop of an equity curve, in percent of the running peak
+    """
+    running_max = np.maximum.accumulate(curve)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = np.where(running_max > 0, (running_max - curve) / running_max * 100, 0.0)
+    return max(float(drawdown.max()), 0.0)
+
+
+def compute_metrics(columns: Dict[str, np.ndarray], initial_capital: float,
+                    max_risk_percent: float, include_curve: bool = True) -> Dict:
+    """
+    Vectorized equivalent of the per-trade loop in backtest-strategy.calculate_metrics
+    """
+    total_trades = len(columns["r_multiple"])
+    if total_trades == 0:
+        return {
+            "error": "No signals match strategy criteria",
+            "total_trades": 0
+        }
+
+    wins = int(np.count_nonzero(columns["win"]))
+    losses = total_trades - wins
+    winrate = wins / total_trades
+    avg_r = float(columns["r_multiple"].mean())
+
+    curve = equity_curve(columns["r_multiple"], initial_capital, max_risk_percent)
+    max_drawdown = max_drawdown_percent(curve)
+
+    final_capital = float(curve[-1])
+    total_profit = final_capital - initial_capital
+    total_profit_percent = (total_profit / initial_capital) * 100
+
+    metrics = {
+        "total_trades": total_trades,
+        "wins": wins,
+        "losses": losses,
+        "winrate": round(winrate, 4),
+        "avg_r_multiple": round(avg_r, 2),
+        "initial_capital": initial_capital,
+        "final_capital": round(final_capital, 2),
+        "total_profit": round(total_profit, 2),
+        "total_profit_percent": round(total_profit_percent, 2),
+        "max_drawdown_percent": round(max_drawdown, 2),
+    }
+    if "gross_r_multiple" in columns:
+        gross_curve = equity_curve(columns["gross_r_multiple"], initial_capital, max_risk_percent)
+        gross_profit_percent = (float(gross_curve[-1]) - initial_capital) / initial_capital * 100
+        metrics["gross"] = {
+            "winrate": round(float(np.count_nonzero(columns["gross_r_multiple"] > 0)) / total_trades, 4),
+            "avg_r_multiple": round(float(columns["gross_r_multiple"].mean()), 2),
+            "final_capital": round(float(gross_curve[-1]), 2),
+            "total_profit_percent": round(gross_profit_percent, 2),
+            "max_drawdown_percent": round(max_drawdown_percent(gross_curve), 2),
+        }
+        metrics["cost_drag_percent"] = round(gross_profit_percent - total_profit_percent, 2)
+    if include_curve:
+        metrics["equity_curve"] = np.round(curve, 2).tolist()
+    return metrics
+
+
+# --- Parameter sweep -------------------------------------------------------
+
+# Price/fill columns ride along so workers can price costs per risk level
+_SWEEP_COLUMNS = ("confidence", "r_multiple", "win", "profit_percent", "entry_price", "stop_loss",
+                  "fill_price", "exit_code", "fill_volume_usd")
+_worker_shm = None
+_worker_columns = None
+
+
+def share_columns(columns: Dict[str, np.ndarray]):
+    """
+    Copy the sweep columns into one shared memory block.
+    Returns (shm, layout) where layout is [(name, dtype, offset, length)].
+    """
+    layout = []
+    offset = 0
+    for name in _SWEEP_COLUMNS:
+        if name not in columns:
+            continue
+        values = columns[name]
+        layout.append((name, values.dtype.str, offset, len(values)))
+        offset += values.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (name, dtype, start, length) in layout:
+        view = np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=start)
+        view[:] = columns[name]
+    return shm, layout
+
+
+def _attach_columns(shm_name: str, layout) -> None:
+    global _worker_shm, _worker_columns
+    # Pool workers share the parent's resource tracker; the parent unlinks the block
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_columns = {
+        name: np.ndarray(length, dtype=dtype, buffer=_worker_shm.buf, offset=start)
+        for (name, dtype, start, length) in layout
+    }
+
+
+def _sweep_row(task) -> List[Dict]:
+    min_confidence, risks, initial_capital, costs = task
+    subset = select(_worker_columns, _worker_columns["confidence"] >= min_confidence)
+    row = []
+    for risk in risks:
+        priced = apply_costs(subset, costs, initial_capital, risk) if costs is not None else subset
+        row.append({
+            "min_confidence": min_confidence,
+            "max_risk_percent": risk,
+            "metrics": compute_metrics(priced, initial_capital, risk, include_curve=False),
+        })
+    return row
+
+
+def run_sweep(columns: Dict[str, np.ndarray], min_confidences: List[float],
+              max_risks: List[float], initial_capital: float, workers: int = None,
+              costs: Dict = None) -> List[Dict]:
+    """
+    Evaluate every (min_confidence, max_risk) pair over a process pool.
+    Signal arrays live in shared memory, so each worker attaches once instead
+    of unpickling the history per task; one task covers a full risk row so the
+    confidence mask is built once per row. With `costs`, every cell is priced
+    at its own risk level and reports gross vs net.
+    """
+    tasks = [(c, list(max_risks), initial_capital, costs) for c in min_confidences]
+    shm, layout = share_columns(columns)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_columns,
+                                 initargs=(shm.name, layout)) as pool:
+            rows = list(pool.map(_sweep_row, tasks))
+    finally:
+        shm.close()
+        shm.unlink()
+    return [cell for row in rows for cell in row]
+
+
+# --- Walk-forward ----------------------------------------------------------
+
+def walk_forward(columns: Dict[str, np.ndarray], candidates: List[float], max_risk_percent: float,
+                 initial_capital: float, train_days: int = 30, test_days: int = 7,
+                 min_train_trades: int = 5) -> Dict:
+    """
+    Slide a train/test window across the history. In each train window pick
+    the min_confidence with the highest compounded return, then trade the
+    following test window with it.
+
+    Train returns come from per-candidate prefix sums of log(1 + risk * r), so
+    every window step is two searchsorted lookups and one subtraction per
+    candidate instead of a recompute over the window.
+    """
+    order = np.argsort(columns['created_at'], kind='stable')
+    columns = {name: values[order] for name, values in columns.items()}
+    ts = columns['created_at']
+    if len(ts) == 0:
+        return {"windows": [], "metrics": compute_metrics(columns, initial_capital, max_risk_percent)}
+
+    candidates = np.asarray(sorted(candidates), dtype=np.float64)
+    log_growth = np.log1p((max_risk_percent / 100) * columns['r_multiple'])
+    eligible = columns['confidence'][None, :] >= candidates[:, None]  # candidates x trades
+    growth_prefix = np.zeros((len(candidates), len(ts) + 1))
+    np.cumsum(np.where(eligible, log_growth, 0.0), axis=1, out=growth_prefix[:, 1:])
+    count_prefix = np.zeros((len(candidates), len(ts) + 1), dtype=np.int64)
+    np.cumsum(eligible, axis=1, out=count_prefix[:, 1:])
+
+    train_ms = train_days * DAY_MS
+    test_ms = test_days * DAY_MS
+    start = (int(ts[0]) // DAY_MS) * DAY_MS
+
+    windows = []
+    oos_parts = []
+    capital = initial_capital
+    while start + train_ms <= ts[-1]:
+        split = start + train_ms
+        stop = split + test_ms
+        lo, mid, hi = np.searchsorted(ts, [start, split, stop], side='left')
+
+        trades = count_prefix[:, mid] - count_prefix[:, lo]
+        growth = growth_prefix[:, mid] - growth_prefix[:, lo]
+        growth = np.where(trades >= min_train_trades, growth, -np.inf)
+        best = int(np.argmax(growth))
+
+        window = {
+            "train_start": _iso_day(start),
+            "test_start": _iso_day(split),
+            "test_end": _iso_day(stop - DAY_MS),
+        }
+        if np.isfinite(growth[best]):
+            chosen = float(candidates[best])
+            test_idx = mid + np.flatnonzero(eligible[best, mid:hi])
+            test = compute_metrics(select(columns, test_idx), capital, max_risk_percent, include_curve=False)
+            window.update({
+                "min_confidence": chosen,
+                "train_trades": int(trades[best]),
+                "train_return_percent": round(float(np.expm1(growth[best]) * 100), 2),
+                "test": test,
+            })
+            if test.get('total_trades'):
+                capital = test['final_capital']
+                oos_parts.append(test_idx)
+        else:
+            window.update({"min_confidence": None, "train_trades": int(trades.max()),
+                           "train_return_percent": None, "test": {"total_trades": 0}})
+        windows.append(window)
+        start += test_ms
+
+    oos_idx = np.concatenate(oos_parts) if oos_parts else np.empty(0, dtype=np.int64)
+    # Compounding the concatenated out-of-sample trades is the stitched curve
+    metrics = compute_metrics(select(columns, oos_idx), initial_capital, max_risk_percent)
+    return {"windows": windows, "metrics": metrics}
+
+
+def _iso_day(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).date().isoformat()
+
+
+# --- Monte Carlo -----------------------------------------------------------
+
+MC_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def monte_carlo(r_multiple: np.ndarray, initial_capital: float, max_risk_percent: float,
+                simulations: int = 10_000, method: str = 'bootstrap', ruin_percent: float = 50.0,
+                seed: int = None, chunk_bytes: int = MC_CHUNK_BYTES) -> Dict:
+    """
+    Resample the trade sequence `simulations` times and report the spread of
+    max drawdown and final capital.
+
+    'bootstrap' draws trades with replacement, 'permute' shuffles the
+    observed order (final capital is then fixed; only the path changes).
+    Paths are evaluated as a (simulations x trades) matrix in row chunks
+    sized to `chunk_bytes`, so memory stays bounded for any simulation count.
+    Risk of ruin is the share of paths whose equity ever falls below
+    (100 - ruin_percent)% of the starting capital.
+    """
+    trades = len(r_multiple)
+    if trades == 0 or simulations <= 0:
+        return {"simulations": 0, "error": "No trades to resample"}
+
+    rng = np.random.default_rng(seed)
+    growth = 1.0 + (max_risk_percent / 100) * np.asarray(r_multiple, dtype=np.float64)
+    rows = max(1, min(simulations, chunk_bytes // (trades * 8)))
+    ruin_level = (100 - ruin_percent) / 100
+
+    drawdowns = np.empty(simulations)
+    finals = np.empty(simulations)
+    ruined = np.empty(simulations, dtype=np.bool_)
+
+    for lo in range(0, simulations, rows):
+        hi = min(lo + rows, simulations)
+        if method == 'permute':
+            paths = rng.permuted(np.broadcast_to(growth, (hi - lo, trades)), axis=1)
+        else:
+            paths = growth[rng.integers(0, trades, size=(hi - lo, trades))]
+        # Equity relative to the starting capital, in place
+        np.multiply.accumulate(paths, axis=1, out=paths)
+        peak = np.maximum.accumulate(paths, axis=1)
+        np.maximum(peak, 1.0, out=peak)  # the starting capital is the first peak
+        drawdowns[lo:hi] = ((peak - paths) / peak).max(axis=1) * 100
+        finals[lo:hi] = paths[:, -1] * initial_capital
+        ruined[lo:hi] = paths.min(axis=1) <= ruin_level
+
+    def percentiles(values):
+        p5, p50, p95 = np.percentile(values, [5, 50, 95])
+        return {"p5": round(float(p5), 2), "p50": round(float(p50), 2), "p95": round(float(p95), 2),
+                "mean": round(float(values.mean()), 2)}
+
+    return {
+        "simulations": simulations,
+        "method": method,
+        "trades_per_path": trades,
+        "max_drawdown_percent": percentiles(drawdowns),
+        "final_capital": percentiles(finals),
+        "ruin_percent": ruin_percent,
+        "risk_of_ruin": round(float(ruined.mean()), 4),
+    }
+
+
+# --- Candle replay ---------------------------------------------------------
+
+REPLAY_CHUNK_CELLS = 4_000_000  # signals x bars examined per vectorized pass
+
+
+def first_crossing(high: np.ndarray, low: np.ndarray, start: np.ndarray, direction: np.ndarray,
+                   stop_loss: np.ndarray, take_profit: np.ndarray, max_bars: int):
+    """
+    For each signal find the first bar at or after `start` whose range touches
+    the stop or the target. Returns (exit_bar, code) with code -1 for stop,
+    +1 for target and 0 when neither is hit within `max_bars`.
+
+    Windows of bars are gathered as a (signals x width) matrix and the first
+    hit is taken with argmax; unresolved signals move on to the next window,
+    which doubles in width. A bar touching both levels counts as a stop.
+    """
+    n = len(high)
+    count = len(start)
+    exit_bar = np.minimum(start + max_bars - 1, n - 1).astype(np.int64)
+    code = np.zeros(count, dtype=np.int8)
+    long = direction > 0
+
+    pending = np.flatnonzero(start < n)
+    offset = 0
+    width = 256
+    while pending.size and offset < max_bars:
+        width = min(width, max_bars - offset)
+        steps = np.arange(width)
+        rows = max(1, REPLAY_CHUNK_CELLS // width)
+        unresolved = []
+        for lo in range(0, pending.size, rows):
+            ids = pending[lo:lo + rows]
+            bars = start[ids, None] + offset + steps[None, :]
+            valid = bars < n
+            bars = np.minimum(bars, n - 1)
+            bar_high = high[bars]
+            bar_low = low[bars]
+            is_long = long[ids, None]
+            stop_hit = np.where(is_long, bar_low <= stop_loss[ids, None], bar_high >= stop_loss[ids, None]) & valid
+            target_hit = np.where(is_long, bar_high >= take_profit[ids, None], bar_low <= take_profit[ids, None]) & valid
+            hit = stop_hit | target_hit
+            found = hit.any(axis=1)
+            first = hit.argmax(axis=1)
+            resolved = ids[found]
+            exit_bar[resolved] = start[resolved] + offset + first[found]
+            code[resolved] = np.where(stop_hit[found, first[found]], -1, 1)
+            # Signals whose window ran past the last candle cannot resolve later
+            still_open = ~found & (start[ids] + offset + width < n)
+            unresolved.append(ids[still_open])
+        pending = np.concatenate(unresolved) if unresolved else pending[:0]
+        offset += width
+        width *= 2
+    return exit_bar, code
+
+
+def replay_signals(columns: Dict[str, np.ndarray], candles_by_symbol: Dict[str, Dict[str, np.ndarray]],
+                   max_bars: int, delay_bars: int = 0) -> Dict[str, np.ndarray]:
+    """
+    Replace outcome fields with what the candles say happened. Each signal
+    fills at its entry price on the first bar opening at or after created_at
+    and exits at the stop, the target, or the close of its last bar. A bar
+    that opens beyond the level it hits (a gap, or a delayed fill already
+    past it) exits at that open instead.
+    With `delay_bars` the fill moves that many bars later, at that bar's open.
+    Signals without price levels or candles are dropped.
+    """
+    replayable = (np.isfinite(columns['entry_price']) & np.isfinite(columns['stop_loss'])
+                  & np.isfinite(columns['take_profit']) & (columns['direction'] != 0)
+                  & (columns['entry_price'] != columns['stop_loss']))
+    keep = np.zeros(len(replayable), dtype=np.bool_)
+    fill_price = columns['entry_price'].astype(np.float64, copy=True)
+    exit_price = np.full(len(replayable), np.nan)
+    exit_ms = np.zeros(len(replayable), dtype=np.int64)
+    exit_code = np.zeros(len(replayable), dtype=np.int8)
+    fill_volume = np.full(len(replayable), np.nan)
+
+    for symbol, candles in candles_by_symbol.items():
+        ids = np.flatnonzero(replayable & (columns['symbol'] == symbol))
+        if not ids.size or not len(candles['ts']):
+            continue
+        start = np.searchsorted(candles['ts'], columns['created_at'][ids], side='left') + delay_bars
+        inside = start < len(candles['ts'])
+        ids, start = ids[inside], start[inside]
+        if delay_bars:
+            fill_price[ids] = candles['open'][start]
+        bar, code = first_crossing(candles['high'], candles['low'], start, columns['direction'][ids],
+                                   columns['stop_loss'][ids], columns['take_profit'][ids], max_bars)
+        level = np.where(code == -1, columns['stop_loss'][ids], columns['take_profit'][ids])
+        bar_open = candles['open'][bar]
+        # Past the stop means below it for a long; past the target means above it
+        gapped = code * columns['direction'][ids] * (bar_open - level) > 0
+        exit_price[ids] = np.where(code == 0, candles['close'][bar], np.where(gapped, bar_open, level))
+        exit_ms[ids] = candles['ts'][bar]
+        exit_code[ids] = code
+        fill_volume[ids] = candles['volume'][start] * candles['close'][start]
+        keep[ids] = True
+
+    replayed = select(columns, keep)
+    fill = fill_price[keep]
+    move = replayed['direction'] * (exit_price[keep] - fill)
+    replayed['fill_price'] = fill
+    replayed['r_multiple'] = move / np.abs(replayed['entry_price'] - replayed['stop_loss'])
+    replayed['profit_percent'] = move / fill * 100
+    replayed['win'] = move > 0
+    replayed['exit_at'] = exit_ms[keep]
+    replayed['exit_code'] = exit_code[keep]
+    replayed['fill_volume_usd'] = fill_volume[keep]
+    return replayed
+
+
+# --- Cost model ------------------------------------------------------------
+#
+# Costs are expressed as a fraction of position notional per trade and then
+# converted to R: a position risking 1R at a stop distance d (fraction of the
+# fill price) has notional 1/d R, so cost_R = cost_fraction / d. This keeps
+# the compounding path fully vectorized - costs are just a smaller r_multiple.
+
+DEFAULT_COSTS = {
+    "maker_fee_percent": 0.02,
+    "taker_fee_percent": 0.10,
+    "entry_liquidity": "taker",  # market entry
+    "exit_liquidity": "taker",  # used when the exit kind is unknown
+    "slippage_bps": 2.0,  # per side, regardless of size
+    "impact_coefficient": 0.1,  # extra slippage fraction per unit of order notional / bar notional volume
+    "delay_bars": 0,  # applied by replay_signals; needs candles
+}
+
+
+def fee_cost(columns: Dict[str, np.ndarray], costs: Dict, notional: np.ndarray) -> np.ndarray:
+    """
+    Entry fee plus exit fee; replayed target exits rest as maker orders
+    """
+    fee = {"maker": costs['maker_fee_percent'] / 100, "taker": costs['taker_fee_percent'] / 100}
+    entry = np.full(len(notional), fee[costs['entry_liquidity']])
+    if 'exit_code' in columns:
+        exit_ = np.where(columns['exit_code'] == 1, fee['maker'], fee['taker'])
+    else:
+        exit_ = np.full(len(notional), fee[costs['exit_liquidity']])
+    return entry + exit_
+
+
+def slippage_cost(columns: Dict[str, np.ndarray], costs: Dict, notional: np.ndarray) -> np.ndarray:
+    """
+    Fixed spread/slippage per side plus linear market impact against the fill bar's volume
+    """
+    per_side = np.full(len(notional), costs['slippage_bps'] / 10_000)
+    volume = columns.get('fill_volume_usd')
+    if volume is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            impact = np.where(volume > 0, costs['impact_coefficient'] * notional / volume, 0.0)
+        per_side = per_side + np.nan_to_num(impact)
+    return 2 * per_side
+
+
+COST_COMPONENTS = [fee_cost, slippage_cost]
+
+
+def apply_costs(columns: Dict[str, np.ndarray], costs: Dict, initial_capital: float,
+                max_risk_percent: float, components: List = None) -> Dict[str, np.ndarray]:
+    """
+    Return columns with net r_multiple/profit_percent/win and the gross R kept
+    as gross_r_multiple. Each component maps (columns, costs, notional) to a
+    cost fraction of notional per trade.
+
+    Order notional for impact is sized from the initial capital; compounding
+    makes later orders larger or smaller, which the impact term ignores.
+    """
+    costs = {**DEFAULT_COSTS, **costs}
+    fill = columns.get('fill_price', columns['entry_price'])
+    stop_distance = np.abs(columns['entry_price'] - columns['stop_loss']) / fill
+    priced = np.isfinite(stop_distance) & (stop_distance > 0)
+    stop_distance = np.where(priced, stop_distance, 1.0)
+    notional = initial_capital * (max_risk_percent / 100) / stop_distance
+
+    fraction = np.zeros(len(fill))
+    for component in components or COST_COMPONENTS:
+        fraction += component(columns, costs, notional)
+    # Signals without price levels cannot be sized and stay gross
+    fraction = np.where(priced, fraction, 0.0)
+
+    net = dict(columns)
+    net['gross_r_multiple'] = columns.get('gross_r_multiple', columns['r_multiple'])
+    net['r_multiple'] = columns['r_multiple'] - fraction / stop_distance
+    net['profit_percent'] = columns['profit_percent'] - fraction * 100
+    net['win'] = net['r_multiple'] > 0
+    return net
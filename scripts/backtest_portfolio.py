@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Event-driven portfolio simulation - overlapping positions under the risk engine limits
+"""
+import heapq
+from datetime import datetime, timezone
+from typing import Dict
+
+import numpy as np
+
+from backtest_engine import DAY_MS, max_drawdown_percent
+
+# Risk engine defaults (docs: ARCHITECTURE.md, risk_profiles table)
+RISK_LIMITS = {
+    "max_positions": 2,
+    "max_positions_per_coin": 1,
+    "risk_per_trade_percent": 0.25,
+    "daily_soft_stop_percent": -2.0,
+    "daily_hard_stop_percent": -4.0,
+    "weekly_soft_stop_percent": -5.0,
+    "weekly_hard_stop_percent": -8.0,
+}
+
+# Reason codes for blocked signals
+MAX_POSITIONS = "MAX_POSITIONS"
+COIN_ALREADY_OPEN = "COIN_ALREADY_OPEN"
+DAILY_SOFT_STOP = "DAILY_SOFT_STOP"
+DAILY_HARD_STOP = "DAILY_HARD_STOP"
+WEEKLY_SOFT_STOP = "WEEKLY_SOFT_STOP"
+WEEKLY_HARD_STOP = "WEEKLY_HARD_STOP"
+
+_CLOSE, _OPEN = 0, 1  # closes sort before opens at the same timestamp
+WEEK_MS = 7 * DAY_MS
+_MONDAY_OFFSET_MS = 3 * DAY_MS  # epoch day 0 was a Thursday
+
+
+def _iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat()
+
+
+def simulate_portfolio(columns: Dict[str, np.ndarray], initial_capital: float, max_risk_percent: float,
+                       limits: Dict = None, default_hold_ms: int = DAY_MS) -> Dict:
+    """
+    Replay signals as open/close events on a priority queue.
+
+    Each open risks min(max_risk_percent, risk_per_trade_percent) of current
+    equity and realises risk * r_multiple when it closes at exit_at (or
+    created_at + default_hold_ms when the exit time is unknown).
+
+    Daily/weekly P&L is realised equity against the equity at the start of
+    the UTC day / ISO week. A soft stop blocks new entries for the rest of the
+    period; a hard stop also fires the kill switch, closing every open
+    position immediately. Kill-switch exits are marked at min(r, 0) since
+    there is no mark price mid-trade: losses are kept, unrealised gains lost.
+    """
+    limits = {**RISK_LIMITS, **(limits or {})}
+    risk_fraction = min(max_risk_percent, limits['risk_per_trade_percent']) / 100
+
+    # Plain lists: per-event numpy scalar access would dominate the loop
+    created = columns['created_at'].tolist()
+    exits = columns['exit_at'].tolist() if 'exit_at' in columns else [0] * len(created)
+    symbols = columns['symbol'].tolist()
+    r_multiple = columns['r_multiple'].tolist()
+
+    events = [(created[i], _OPEN, i) for i in range(len(created))]
+    heapq.heapify(events)
+
+    equity = initial_capital
+    curve = [equity]
+    open_positions = {}  # signal index -> risk amount
+    open_coins = {}  # symbol -> open count
+    blocked = []
+    taken_r = []
+    kill_switches = 0
+
+    day = week = None
+    day_start_equity = week_start_equity = equity
+    day_state = week_state = None  # None | 'soft' | 'hard'
+
+    def close(i, r):
+        nonlocal equity
+        risk_amount = open_positions.pop(i)
+        equity += risk_amount * r
+        curve.append(equity)
+        taken_r.append(r)
+        open_coins[symbols[i]] -= 1
+
+    def check_stops(now):
+        nonlocal day_state, week_state, kill_switches
+        day_pnl = (equity - day_start_equity) / day_start_equity * 100
+        week_pnl = (equity - week_start_equity) / week_start_equity * 100
+        hard = False
+        if day_pnl <= limits['daily_hard_stop_percent'] and day_state != 'hard':
+            day_state = 'hard'
+            hard = True
+        elif day_pnl <= limits['daily_soft_stop_percent'] and day_state is None:
+            day_state = 'soft'
+        if week_pnl <= limits['weekly_hard_stop_percent'] and week_state != 'hard':
+            week_state = 'hard'
+            hard = True
+        elif week_pnl <= limits['weekly_soft_stop_percent'] and week_state is None:
+            week_state = 'soft'
+        if hard and open_positions:
+            kill_switches += 1
+            for i in list(open_positions):
+                close(i, min(r_multiple[i], 0.0))
+
+    while events:
+        now, kind, i = heapq.heappop(events)
+
+        # Roll the daily / weekly windows forward
+        if now // DAY_MS != day:
+            day = now // DAY_MS
+            day_start_equity = equity
+            day_state = None
+        if (now + _MONDAY_OFFSET_MS) // WEEK_MS != week:
+            week = (now + _MONDAY_OFFSET_MS) // WEEK_MS
+            week_start_equity = equity
+            week_state = None
+
+        if kind == _CLOSE:
+            if i in open_positions:  # may already be gone via the kill switch
+                close(i, r_multiple[i])
+                check_stops(now)
+            continue
+
+        reason = None
+        if week_state is not None:
+            reason = WEEKLY_HARD_STOP if week_state == 'hard' else WEEKLY_SOFT_STOP
+        elif day_state is not None:
+            reason = DAILY_HARD_STOP if day_state == 'hard' else DAILY_SOFT_STOP
+        elif len(open_positions) >= limits['max_positions']:
+            reason = MAX_POSITIONS
+        elif open_coins.get(symbols[i], 0) >= limits['max_positions_per_coin']:
+            reason = COIN_ALREADY_OPEN
+        if reason:
+            blocked.append({"index": i, "symbol": symbols[i], "created_at": _iso(now), "reason": reason})
+            continue
+
+        open_positions[i] = equity * risk_fraction
+        open_coins[symbols[i]] = open_coins.get(symbols[i], 0) + 1
+        # 0 marks an unknown exit; an exit on the entry's own millisecond is real
+        # (first-bar stop/target) and closes before the next open at that instant
+        exit_at = exits[i] if exits[i] and exits[i] >= now else now + default_hold_ms
+        heapq.heappush(events, (exit_at, _CLOSE, i))
+
+    reasons = {}
+    for b in blocked:
+        reasons[b['reason']] = reasons.get(b['reason'], 0) + 1
+
+    total_trades = len(taken_r)
+    if total_trades == 0:
+        metrics = {"error": "No signals passed the risk engine", "total_trades": 0}
+    else:
+        curve_array = np.asarray(curve)
+        wins = sum(1 for r in taken_r if r > 0)
+        total_profit = equity - initial_capital
+        metrics = {
+            "total_trades": total_trades,
+            "wins": wins,
+            "losses": total_trades - wins,
+            "winrate": round(wins / total_trades, 4),
+            "avg_r_multiple": round(sum(taken_r) / total_trades, 2),
+            "initial_capital": initial_capital,
+            "final_capital": round(equity, 2),
+            "total_profit": round(total_profit, 2),
+            "total_profit_percent": round(total_profit / initial_capital * 100, 2),
+            "max_drawdown_percent": round(max_drawdown_percent(curve_array), 2),
+            "equity_curve": np.round(curve_array, 2).tolist(),
+        }
+
+    return {
+        "metrics": metrics,
+        "limits": limits,
+        "effective_risk_percent": risk_fraction * 100,
+        "signals": len(created),
+        "blocked_count": len(blocked),
+        "blocked_by_reason": reasons,
+        "kill_switches": kill_switches,
+        "blocked": blocked,
+    }
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Bulk-load signals from JSONL/CSV into aisignal - COPY over SUPABASE_DB_URL, REST otherwise
+"""
+import csv
+import sys
+import json
+import time
+import argparse
+
+import pg_fastpath
+import signal_keys
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Bulk-load signals')
+    parser.add_argument('--input', required=True, help='JSONL (one object per line) or CSV with a header row')
+    parser.add_argument('--table', default='aisignal')
+    parser.add_argument('--columns', help='Comma-separated column list (default: keys of the first row)')
+    parser.add_argument('--method', choices=['auto', 'copy', 'values', 'rest'], default='auto',
+                        help='auto = COPY when SUPABASE_DB_URL and psycopg2 are available, else REST')
+    parser.add_argument('--source', default='bulk-load', help='Producer name, part of the signal key')
+    parser.add_argument('--update', action='store_true', help='Merge rows whose key exists instead of skipping them')
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help='Plain insert without signal keys (table without the signal_key index)')
+    return parser.parse_args()
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            # Empty CSV cells load as NULL rather than ''
+            for row in csv.DictReader(f):
+                yield {k: (v if v != '' else None) for k, v in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def main():
+    args = parse_args()
+    columns = args.columns.split(',') if args.columns else None
+
+    if args.method in ('copy', 'values') and not pg_fastpath.available():
+        print("❌ Direct load needs SUPABASE_DB_URL and psycopg2 (pip install psycopg2-binary)")
+        sys.exit(1)
+
+    rows = read_rows(args.input)
+    conflict_key = None
+    if not args.no_dedupe:
+        rows = signal_keys.with_keys(rows, args.source)
+        conflict_key = signal_keys.SIGNAL_KEY_COLUMN
+        if columns and conflict_key not in columns:
+            columns.append(conflict_key)
+
+    print(f"📥 Loading {args.input} into {args.table}...")
+    start = time.perf_counter()
+    try:
+        count, method = pg_fastpath.load_signals(rows, args.table, columns, args.method,
+                                                 conflict_key=conflict_key, update=args.update)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read {args.input}: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"✅ {count} rows written via {method} in {elapsed:.1f}s ({rate:,.0f} rows/s)")
+
+if __name__ == '__main__':
+    main()
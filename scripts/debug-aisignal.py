@@ -1,24 +1,17 @@
 #!/usr/bin/env python3
 """Debug script to inspect aisignal table contents"""
-import os
 import sys
-import requests
 import json
 
-SUPABASE_PROJECT_ID = os.environ.get('SUPABASE_PROJECT_ID', 'swfyuwkptusceiouqlks')
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+from postgrest_client import SUPABASE_PROJECT_ID, SUPABASE_SERVICE_ROLE_KEY, PostgrestClient
 
 if not SUPABASE_SERVICE_ROLE_KEY:
     print("❌ Error: SUPABASE_SERVICE_ROLE_KEY not set")
     sys.exit(1)
 
-BASE_URL = f"https://{SUPABASE_PROJECT_ID}.supabase.co/rest/v1"
-HEADERS = {
-    "apikey": SUPABASE_SERVICE_ROLE_KEY,
-    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-    "Content-Type": "application/json",
-    "Prefer": "return=representation"
-}
+client = PostgrestClient()
+BASE_URL = client.base_url
+HEADERS = {"Prefer": "return=representation"}  # auth, JSON and gzip headers come from the client
 
 print("="*70)
 print("🔍 AISIGNAL TABLE DEBUG")
@@ -37,7 +30,7 @@ try:
     url = f"{BASE_URL}/aisignal?order=created_at.desc&limit=100"
     print(f"URL: {url}")
     
-    response = requests.get(url, headers=HEADERS)
+    response = client.get(url, headers=HEADERS)
     print(f"HTTP Status: {response.status_code}")
     
     if response.status_code == 200:
@@ -72,7 +65,7 @@ try:
     url = f"{BASE_URL}/aisignal?status=eq.PENDING&order=created_at.desc"
     print(f"URL: {url}")
     
-    response = requests.get(url, headers=HEADERS)
+    response = client.get(url, headers=HEADERS)
     print(f"HTTP Status: {response.status_code}")
     
     if response.status_code == 200:
@@ -99,7 +92,7 @@ print("="*70)
 # Try to get one row to see column structure
 try:
     url = f"{BASE_URL}/aisignal?limit=1"
-    response = requests.get(url, headers=HEADERS)
+    response = client.get(url, headers=HEADERS)
     
     if response.status_code == 200:
         data = response.json()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Export aisignal history to a local columnar snapshot for offline backtests
+"""
+import sys
+import time
+import argparse
+
+import backtest_data
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export signal history snapshot')
+    parser.add_argument('--output-dir', default='data/signal-snapshot', help='Snapshot root directory')
+    parser.add_argument('--start-date', default='2024-01-01', help='First day to export (ignored once a snapshot exists)')
+    parser.add_argument('--end-date', help='Last day to export (default: today)')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    
+    print("="*70)
+    print("🗄️  SIGNAL SNAPSHOT EXPORT")
+    print("="*70)
+    print()
+    
+    if not backtest_data.has_credentials():
+        print("❌ Error: SUPABASE_SERVICE_ROLE_KEY not set")
+        sys.exit(1)
+    
+    previous = backtest_data.read_manifest(args.output_dir)
+    if previous.get('complete') and previous.get('closed_cursor'):
+        print(f"🔄 Incremental refresh of signals closed after {previous['closed_cursor'][0]} "
+              f"({previous['rows']} rows on disk)")
+    elif previous['cursor']:
+        print(f"🔄 Resuming export after {previous['cursor'][0]} ({previous['rows']} rows on disk)")
+    else:
+        print(f"📥 Full export from {args.start_date}")
+    
+    started = time.perf_counter()
+    manifest = backtest_data.refresh_snapshot(args.output_dir, args.start_date, args.end_date)
+    elapsed = time.perf_counter() - started
+    
+    print()
+    print(f"✅ Added {manifest['added']} rows in {elapsed:.1f}s")
+    print(f"   Total rows: {manifest['rows']}")
+    print(f"   Partitions: {len(manifest['partitions'])} (month x symbol)")
+    print(f"💾 Snapshot: {args.output_dir}")
+    print()
+
+if __name__ == '__main__':
+    main()
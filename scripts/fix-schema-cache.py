@@ -2,24 +2,20 @@
 """Automatically fix Supabase schema cache issues"""
 import os
 import sys
-import requests
 import time
 
-SUPABASE_PROJECT_ID = os.environ.get('SUPABASE_PROJECT_ID', 'swfyuwkptusceiouqlks')
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+import aisignal_schema
+
+from postgrest_client import SUPABASE_SERVICE_ROLE_KEY, PostgrestClient
 SUPABASE_DB_URL = os.environ.get('SUPABASE_DB_URL', '')
 
 if not SUPABASE_SERVICE_ROLE_KEY:
     print("❌ SUPABASE_SERVICE_ROLE_KEY not set")
     sys.exit(1)
 
-BASE_URL = f"https://{SUPABASE_PROJECT_ID}.supabase.co/rest/v1"
-HEADERS = {
-    "apikey": SUPABASE_SERVICE_ROLE_KEY,
-    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-    "Content-Type": "application/json",
-    "Prefer": "return=representation"
-}
+client = PostgrestClient()
+BASE_URL = client.base_url
+HEADERS = {"Prefer": "return=representation"}  # auth, JSON and gzip headers come from the client
 
 print("="*70)
 print("🔧 SUPABASE SCHEMA CACHE FIX")
@@ -56,116 +52,38 @@ time.sleep(2)
 print("✅ Done")
 print()
 
-# Step 3: Try different column combinations to find what works
-print("3️⃣  Testing column combinations...")
-
-test_combinations = [
-    # Most complete
-    {
-        "pair": "BTCUSDT",
-        "signal_type": "BUY",
-        "confidence_score": 80,
-        "status": "PENDING"
-    },
-    # Without confidence_score
-    {
-        "pair": "BTCUSDT",
-        "signal_type": "BUY",
-        "confidence": 0.80,  # Try old format
-        "status": "PENDING"
-    },
-    # Minimal
-    {
-        "pair": "BTCUSDT",
-        "signal_type": "BUY",
-        "status": "PENDING"
-    },
-    # With symbol instead of pair
-    {
-        "symbol": "BTCUSDT",
-        "direction": "LONG",
-        "status": "pending"
-    }
-]
+# Step 3: Re-resolve the table schema now that the cache is fresh (no trial inserts)
+print("3️⃣  Discovering actual table schema...")
 
 working_schema = None
 
-for idx, combo in enumerate(test_combinations, 1):
-    print(f"\n   Testing combo {idx}: {list(combo.keys())}")
-    
-    try:
-        response = requests.post(
-            f"{BASE_URL}/aisignal",
-            headers=HEADERS,
-            json=combo
-        )
-        
-        if response.status_code in [200, 201]:
-            print(f"   ✅ SUCCESS! This schema works:")
-            print(f"      {combo}")
-            working_schema = combo
-            break
-        else:
-            error = response.json() if response.text else {}
-            if 'message' in error and 'column' in error['message']:
-                missing_col = error['message'].split("'")[1] if "'" in error['message'] else "unknown"
-                print(f"   ❌ Missing column: {missing_col}")
-            else:
-                print(f"   ❌ Failed: {response.status_code}")
-    except Exception as e:
-        print(f"   ❌ Error: {e}")
-
-print()
-
-# Step 4: Get actual working columns from REST API
-print("4️⃣  Discovering actual table schema via REST API...")
-
 try:
-    # Try to get empty result set to see column structure
-    response = requests.get(
-        f"{BASE_URL}/aisignal?limit=0",
-        headers=HEADERS
-    )
-    
-    if response.status_code == 200:
-        print("✅ REST API accessible")
-        
-        # Try getting one row to see structure
-        response = requests.get(
-            f"{BASE_URL}/aisignal?limit=1",
-            headers=HEADERS
-        )
+    aisignal_schema.invalidate()
+    mapping = aisignal_schema.load_mapping(BASE_URL, HEADERS, client, refresh=True)
+    if mapping:
+        print("\n📋 Available columns in REST API:")
+        for col in mapping['columns']:
+            print(f"   - {col}")
+        print(f"\n🧭 Field mapping: {mapping['fields']}")
         
-        if response.status_code == 200:
-            data = response.json()
-            if len(data) > 0:
-                print("\n📋 Available columns in REST API:")
-                for col in sorted(data[0].keys()):
-                    print(f"   - {col}")
-                    
-                # Save working schema
-                working_schema = {
-                    k: v for k, v in {
-                        "pair": "BTCUSDT",
-                        "signal_type": "BUY",
-                        "status": "PENDING"
-                    }.items() if k in data[0]
-                }
+        # Working schema: the minimal insert in this table's dialect
+        working_schema = aisignal_schema.build_insert(mapping, symbol="BTCUSDT", side="BUY", confidence=0.80)
+    else:
+        print("⚠️  Schema not readable and table is empty")
 except Exception as e:
     print(f"⚠️  Could not discover schema: {e}")
 
 print()
 
-# Step 5: Save working schema to file
+# Step 4: Save working schema to file
 if working_schema:
-    print("5️⃣  Saving working schema...")
+    print("4️⃣  Saving working schema...")
     
-    schema_file = "/tmp/klarpakke_working_schema.json"
+    # Insert plan for adaptive-insert-signal.py, fingerprinted against the fresh columns
+    aisignal_schema.save_plan(BASE_URL, mapping)
     import json
-    with open(schema_file, 'w') as f:
-        json.dump(working_schema, f, indent=2)
     
-    print(f"✅ Saved to: {schema_file}")
+    print(f"✅ Saved to: {aisignal_schema.INSERT_PLAN_FILE}")
     print()
     print("📋 Working schema:")
     print(json.dumps(working_schema, indent=2))
@@ -179,6 +97,6 @@ print("="*70)
 print()
 print("📝 Next steps:")
 print("   1. Use working schema for inserts")
-print("   2. Update analyze_signals.py to use working columns")
+print("   2. analyze_signals.py picks up the refreshed column cache automatically")
 print("   3. Re-run: python3 scripts/insert-test-signal.py")
 print()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Import OHLCV candles from CSV into the mmap layout used by backtest --candles
+"""
+import sys
+import argparse
+
+import numpy as np
+
+import backtest_data
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Import OHLCV candles')
+    parser.add_argument('--csv', required=True,
+                        help='CSV with open_time(ms),open,high,low,close,volume columns (Binance kline export)')
+    parser.add_argument('--symbol', required=True, help='Symbol as stored on signals, e.g. BTCUSDT')
+    parser.add_argument('--output-dir', default='data/candles')
+    parser.add_argument('--skip-header', action='store_true', help='First CSV line is a header')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    
+    print(f"🕯️  Importing {args.csv} as {args.symbol}...")
+    try:
+        raw = np.loadtxt(args.csv, delimiter=',', skiprows=1 if args.skip_header else 0,
+                         usecols=range(6), ndmin=2)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read {args.csv}: {e}")
+        sys.exit(1)
+    
+    candles = {name: raw[:, i] for i, name in enumerate(backtest_data.CANDLE_COLUMNS)}
+    backtest_data.write_candles(args.output_dir, args.symbol, candles)
+    print(f"✅ Stored {len(raw)} candles in {args.output_dir}")
+
+if __name__ == '__main__':
+    main()
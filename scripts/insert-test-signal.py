@@ -1,24 +1,17 @@
 #!/usr/bin/env python3
 """Insert a test signal into aisignal table"""
-import os
 import sys
-import requests
 import json
 
-SUPABASE_PROJECT_ID = os.environ.get('SUPABASE_PROJECT_ID', 'swfyuwkptusceiouqlks')
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+from postgrest_client import SUPABASE_SERVICE_ROLE_KEY, PostgrestClient
 
 if not SUPABASE_SERVICE_ROLE_KEY:
     print("❌ Error: SUPABASE_SERVICE_ROLE_KEY not set")
     sys.exit(1)
 
-BASE_URL = f"https://{SUPABASE_PROJECT_ID}.supabase.co/rest/v1"
-HEADERS = {
-    "apikey": SUPABASE_SERVICE_ROLE_KEY,
-    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-    "Content-Type": "application/json",
-    "Prefer": "return=representation"
-}
+client = PostgrestClient()
+BASE_URL = client.base_url
+HEADERS = {"Prefer": "return=representation"}  # auth, JSON and gzip headers come from the client
 
 print("="*70)
 print("📥 INSERT TEST SIGNAL")
@@ -40,7 +33,7 @@ try:
     url = f"{BASE_URL}/aisignal"
     print(f"🌐 Inserting to: {url}")
     
-    response = requests.post(url, headers=HEADERS, json=test_signal)
+    response = client.post(url, headers=HEADERS, json=test_signal)
     
     print(f"\n📊 HTTP Status: {response.status_code}")
     
@@ -55,7 +48,7 @@ try:
         # Verify it's there
         print("\n🔍 Verifying signal exists...")
         verify_url = f"{BASE_URL}/aisignal?id=eq.{signal_id}"
-        verify_response = requests.get(verify_url, headers=HEADERS)
+        verify_response = client.get(verify_url, headers=HEADERS)
         
         if verify_response.status_code == 200:
             verify_data = verify_response.json()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Direct Postgres bulk loads over SUPABASE_DB_URL - COPY / execute_values, REST fallback
+"""
+import io
+import os
+import json
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import psycopg2
+    from psycopg2 import pool, sql
+    from psycopg2.extras import execute_values
+except ImportError:  # REST fallback only
+    psycopg2 = None
+
+SUPABASE_DB_URL = os.environ.get('SUPABASE_DB_URL')
+POOL_SIZE = int(os.environ.get('PG_POOL_SIZE', '4'))
+COPY_CHUNK_ROWS = 50000  # rows per COPY / transaction - bounds memory, keeps progress
+VALUES_PAGE_SIZE = 1000  # rows per execute_values statement
+REST_CHUNK_ROWS = 500
+
+_pool = None
+
+
+def available() -> bool:
+    return psycopg2 is not None and bool(SUPABASE_DB_URL)
+
+
+def get_pool():
+    """Process-wide connection pool, created on first use"""
+    global _pool
+    if _pool is None:
+        _pool = pool.ThreadedConnectionPool(1, POOL_SIZE, SUPABASE_DB_URL)
+    return _pool
+
+
+@contextmanager
+def connection():
+    """Pooled connection; commits on success, rolls back on error"""
+    conn = get_pool().getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        get_pool().putconn(conn)
+
+
+def _chunked(rows: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_value(value) -> str:
+    """One field in COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _conflict_clause(columns: Sequence[str], conflict_key: Optional[str], update: bool):
+    if not conflict_key:
+        return sql.SQL('')
+    if not update:
+        return sql.SQL("ON CONFLICT ({}) DO NOTHING").format(sql.Identifier(conflict_key))
+    assignments = [sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(c)) for c in columns if c != conflict_key]
+    return sql.SQL("ON CONFLICT ({}) DO UPDATE SET {}").format(sql.Identifier(conflict_key),
+                                                               sql.SQL(', ').join(assignments))
+
+
+def copy_rows(table: str, columns: Sequence[str], rows: Iterable[Sequence],
+              conflict_key: Optional[str] = None, update: bool = False) -> int:
+    """
+    Stream rows (tuples in `columns` order) with COPY FROM STDIN,
+    COPY_CHUNK_ROWS per transaction. With conflict_key each chunk is copied
+    into a temp table and moved over with INSERT ... ON CONFLICT, since COPY
+    itself cannot skip or merge duplicates.
+    Returns the number of rows inserted (or updated).
+    """
+    column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+    target = sql.Identifier(f"_stage_{table}") if conflict_key else sql.Identifier(table)
+    copy = sql.SQL("COPY {} ({}) FROM STDIN").format(target, column_list)
+    if conflict_key:
+        # Created and dropped inside each chunk's transaction: behind the
+        # transaction pooler (:6543) consecutive transactions may run on
+        # different backends, so nothing may outlive a commit
+        stage = sql.SQL("CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA").format(
+            target, column_list, sql.Identifier(table))
+        # DISTINCT ON: DO UPDATE may not touch one row twice in a statement
+        move = sql.SQL("INSERT INTO {} ({}) SELECT DISTINCT ON ({}) {} FROM {} {}").format(
+            sql.Identifier(table), column_list, sql.Identifier(conflict_key), column_list, target,
+            _conflict_clause(columns, conflict_key, update))
+    loaded = 0
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            for chunk in _chunked(rows, COPY_CHUNK_ROWS):
+                buffer = io.StringIO()
+                for row in chunk:
+                    buffer.write('\t'.join(_copy_value(v) for v in row))
+                    buffer.write('\n')
+                buffer.seek(0)
+                if conflict_key:
+                    cursor.execute(stage)
+                cursor.copy_expert(copy.as_string(conn), buffer)
+                if conflict_key:
+                    cursor.execute(move)
+                    loaded += cursor.rowcount
+                else:
+                    loaded += len(chunk)
+                conn.commit()
+    return loaded
+
+
+def insert_rows(table: str, columns: Sequence[str], rows: Iterable[Sequence],
+                conflict_key: Optional[str] = None, update: bool = False) -> int:
+    """
+    Multi-row INSERT via execute_values, optionally ON CONFLICT (conflict_key)
+    DO NOTHING, or DO UPDATE with update=True. Returns rows inserted (or updated).
+    """
+    statement = sql.SQL("INSERT INTO {} ({}) VALUES %s {}").format(
+        sql.Identifier(table), sql.SQL(', ').join(map(sql.Identifier, columns)),
+        _conflict_clause(columns, conflict_key, update))
+    inserted = 0
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            query = statement.as_string(conn)
+            for chunk in _chunked(rows, COPY_CHUNK_ROWS):
+                for page in _chunked(chunk, VALUES_PAGE_SIZE):
+                    execute_values(cursor, query, [tuple(_adapt(v) for v in row) for row in page],
+                                   page_size=VALUES_PAGE_SIZE)
+                    inserted += cursor.rowcount
+                conn.commit()
+    return inserted
+
+
+def _adapt(value):
+    return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+
+def load_signals(rows: Iterable[Dict], table: str = 'aisignal', columns: Optional[Sequence[str]] = None,
+                 method: str = 'auto', rest=None, conflict_key: Optional[str] = None,
+                 update: bool = False) -> Tuple[int, str]:
+    """
+    Bulk-load signal dicts. 'auto' uses COPY when SUPABASE_DB_URL and psycopg2
+    are available, otherwise chunked concurrent REST inserts through `rest`
+    (a supabase_async.SupabaseData, created on demand). With conflict_key,
+    rows whose key already exists are skipped (or merged with update=True).
+    Returns (rows written, method used); over REST that is rows sent.
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0, method
+    columns = list(columns or first.keys())
+
+    def tuples():
+        yield tuple(first.get(c) for c in columns)
+        for row in rows:
+            yield tuple(row.get(c) for c in columns)
+
+    if method == 'auto':
+        method = 'copy' if available() else 'rest'
+    if method == 'copy':
+        return copy_rows(table, columns, tuples(), conflict_key, update), method
+    if method == 'values':
+        return insert_rows(table, columns, tuples(), conflict_key, update), method
+
+    if rest is None:
+        from supabase_async import SupabaseData
+        rest = SupabaseData()
+    loaded = 0
+    for chunk in _chunked(tuples(), COPY_CHUNK_ROWS):
+        payload = [dict(zip(columns, row)) for row in chunk]
+        if conflict_key:
+            loaded += rest.upsert(table, payload, on_conflict=conflict_key, ignore_duplicates=not update,
+                                  chunk_size=REST_CHUNK_ROWS)
+        else:
+            loaded += rest.insert(table, payload, chunk_size=REST_CHUNK_ROWS)
+    return loaded, method
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Shared Supabase PostgREST client - pooled keep-alive session, default timeouts, jittered retries
+"""
+import os
+import time
+import random
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx  # HTTP/2 needs httpx[http2]; plain requests otherwise
+    import h2  # noqa: F401
+except ImportError:
+    httpx = None
+
+SUPABASE_PROJECT_ID = os.environ.get('SUPABASE_PROJECT_ID', 'swfyuwkptusceiouqlks')
+SUPABASE_SERVICE_ROLE_KEY = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+BASE_URL = f"https://{SUPABASE_PROJECT_ID}.supabase.co/rest/v1"
+
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+POOL_SIZE = int(os.environ.get('POSTGREST_POOL_SIZE', '10'))
+MAX_RETRIES = int(os.environ.get('POSTGREST_MAX_RETRIES', '4'))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+HTTP2 = os.environ.get('POSTGREST_HTTP2', 'auto')  # auto | 1 | 0
+
+# 429 and 503 mean the request was not processed, so any method may retry them.
+# Other 5xx may have been applied: only methods that are safe to repeat retry.
+ALWAYS_RETRY = {429, 503}
+IDEMPOTENT_RETRY = {500, 502, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'PATCH', 'DELETE'}
+
+
+class _Http2Response:
+    """requests-compatible view of an httpx response, so callers handle one exception family"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.content
+        self.text = response.text
+        self.url = str(response.url)
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return self._response.json()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+class PostgrestClient:
+    """
+    One pooled connection per host for every call a script makes.
+    Accepts full URLs or paths relative to base_url, and the requests
+    keyword arguments (params, json, headers, timeout).
+    """
+
+    def __init__(self, base_url: str = BASE_URL, api_key: Optional[str] = SUPABASE_SERVICE_ROLE_KEY,
+                 timeout=DEFAULT_TIMEOUT, max_retries: int = MAX_RETRIES, pool_size: int = POOL_SIZE,
+                 http2: Optional[bool] = None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.headers = {
+            "apikey": api_key or "",
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip",
+        }
+        if http2 is None:
+            http2 = HTTP2 == '1' or (HTTP2 == 'auto' and httpx is not None)
+        self.http2 = bool(http2 and httpx is not None)
+        if self.http2:
+            connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            self._client = httpx.Client(http2=True, headers=self.headers,
+                                        timeout=httpx.Timeout(read, connect=connect),
+                                        limits=httpx.Limits(max_connections=pool_size,
+                                                            max_keepalive_connections=pool_size))
+        else:
+            self._client = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self._client.mount("https://", adapter)
+            self._client.mount("http://", adapter)
+            self._client.headers.update(self.headers)
+
+    def url(self, path: str) -> str:
+        if path.startswith(('http://', 'https://')):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _send(self, method: str, url: str, **kwargs):
+        if not self.http2:
+            kwargs.setdefault('timeout', self.timeout)
+            return self._client.request(method, url, **kwargs)
+        timeout = kwargs.pop('timeout', None)
+        if timeout is not None:
+            connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            kwargs['timeout'] = httpx.Timeout(read, connect=connect)
+        try:
+            return _Http2Response(self._client.request(method, url, **kwargs))
+        except httpx.ConnectTimeout as e:
+            raise requests.ConnectTimeout(str(e)) from e
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e)) from e
+
+    def _delay(self, attempt: int, response=None) -> float:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+        # Full jitter: spread retries from many workers instead of synchronising them
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def request(self, method: str, path: str, **kwargs):
+        method = method.upper()
+        url = self.url(path)
+        idempotent = method in IDEMPOTENT_METHODS
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                response = self._send(method, url, **kwargs)
+            except requests.ConnectTimeout:
+                if last:
+                    raise
+                time.sleep(self._delay(attempt))  # never reached the server
+                continue
+            except (requests.ConnectionError, requests.Timeout):
+                if last or not idempotent:
+                    raise
+                time.sleep(self._delay(attempt))
+                continue
+            retryable = response.status_code in ALWAYS_RETRY or (
+                idempotent and response.status_code in IDEMPOTENT_RETRY)
+            if not retryable or last:
+                return response
+            time.sleep(self._delay(attempt, response))
+
+    def get(self, path: str, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def patch(self, path: str, **kwargs):
+        return self.request('PATCH', path, **kwargs)
+
+    def delete(self, path: str, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self) -> None:
+        self._client.close()
+
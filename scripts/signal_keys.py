@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Deterministic aisignal keys - idempotent ingestion via a unique signal_key column
+"""
+import os
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional
+
+SIGNAL_KEY_COLUMN = 'signal_key'
+KEY_BUCKET_SECONDS = int(os.environ.get('AISIGNAL_KEY_BUCKET', '3600'))
+PRICE_DIGITS = 5  # significant digits of entry_price that make two signals distinct
+SEEN_KEYS_MAX = 100000
+
+# Column variants per key part, modern schema first (as aisignal_schema.FIELD_VARIANTS)
+SYMBOL_COLUMNS = ('pair', 'symbol')
+SIDE_COLUMNS = ('signal_type', 'direction')
+SIDES = {"BUY": "BUY", "LONG": "BUY", "SELL": "SELL", "SHORT": "SELL"}
+
+
+def _epoch(at) -> float:
+    if at is None:
+        return datetime.now(timezone.utc).timestamp()
+    if isinstance(at, (int, float)):
+        return at / 1000 if at > 1e11 else at  # epoch ms or s
+    if isinstance(at, str):
+        at = datetime.fromisoformat(at.replace('Z', '+00:00'))
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at.timestamp()
+
+
+def signal_key(symbol: str, side: str, entry_price: Optional[float] = None, at=None,
+               source: str = '', bucket_seconds: int = KEY_BUCKET_SECONDS) -> str:
+    """
+    Same symbol, direction, entry (to PRICE_DIGITS significant digits),
+    time bucket and source -> same key. BUY/LONG and SELL/SHORT are one side.
+    """
+    side = (side or '').upper()
+    parts = (
+        (symbol or '').upper(),
+        SIDES.get(side, side),
+        f"{float(entry_price):.{PRICE_DIGITS}g}" if entry_price is not None else '',
+        str(int(_epoch(at) // bucket_seconds)),
+        source or '',
+    )
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()[:32]
+
+
+def row_key(row: Dict, source: str = '', bucket_seconds: int = KEY_BUCKET_SECONDS) -> str:
+    """Key of an insert payload in either column dialect; created_at defaults to now"""
+    symbol = next((row[c] for c in SYMBOL_COLUMNS if row.get(c)), None)
+    side = next((row[c] for c in SIDE_COLUMNS if row.get(c)), None)
+    return signal_key(symbol, side, row.get('entry_price'), row.get('created_at'), source, bucket_seconds)
+
+
+class SeenKeys:
+    """Bounded LRU of recently written keys - skips repeats before they cost a round trip"""
+
+    def __init__(self, maxsize: int = SEEN_KEYS_MAX):
+        self.maxsize = maxsize
+        self._keys = OrderedDict()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: str) -> bool:
+        """True if the key is new; refreshes its recency either way"""
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return False
+        self._keys[key] = None
+        if len(self._keys) > self.maxsize:
+            self._keys.popitem(last=False)
+        return True
+
+
+def with_keys(rows: Iterable[Dict], source: str = '', seen: Optional[SeenKeys] = None,
+              bucket_seconds: int = KEY_BUCKET_SECONDS) -> Iterator[Dict]:
+    """
+    Stamp signal_key on each row (keeping one already present) and drop rows
+    whose key was seen, so one batch never carries the same key twice.
+    """
+    seen = seen if seen is not None else SeenKeys()
+    for row in rows:
+        key = row.get(SIGNAL_KEY_COLUMN) or row_key(row, source, bucket_seconds)
+        if seen.add(key):
+            yield {**row, SIGNAL_KEY_COLUMN: key}
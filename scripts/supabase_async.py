@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Async data access for aisignal/positions - concurrent bulk fetch, insert, upsert and patch
+"""
+import asyncio
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from postgrest_client import PostgrestClient
+
+CONCURRENCY = int(os.environ.get('SUPABASE_CONCURRENCY', '8'))
+CHUNK_SIZE = 500  # rows per insert/upsert body
+ID_CHUNK_SIZE = 200  # ids per id=in.(...) filter - keeps URLs under proxy limits
+
+Filters = Union[Dict[str, str], Sequence[Tuple[str, str]]]
+
+
+def _chunks(items: Sequence, size: int) -> List[Sequence]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _in_filter(ids: Iterable) -> str:
+    return f"in.({','.join(str(i) for i in ids)})"
+
+
+class AsyncSupabase:
+    """
+    Requests run on the shared pooled, retrying PostgrestClient from a thread
+    pool; a semaphore caps how many are in flight, so connection pool, worker
+    threads and concurrency limit are all the same size.
+    """
+
+    def __init__(self, client: Optional[PostgrestClient] = None, concurrency: int = CONCURRENCY):
+        self.client = client or PostgrestClient(pool_size=concurrency)
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='supabase')
+        self._semaphores = weakref.WeakKeyDictionary()  # one per event loop
+
+    async def request(self, method: str, path: str, **kwargs):
+        loop = asyncio.get_running_loop()
+        # asyncio.run() in the sync facade gives every call a fresh loop
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        async with semaphore:
+            response = await loop.run_in_executor(self._executor,
+                                                  partial(self.client.request, method, path, **kwargs))
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    # --- Reads ---------------------------------------------------------------
+
+    async def fetch(self, table: str, filters: Filters = (), select: str = '*',
+                    order: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        params = [("select", select)] + list(filters.items() if isinstance(filters, dict) else filters)
+        if order:
+            params.append(("order", order))
+        if limit is not None:
+            params.append(("limit", str(limit)))
+        return await self.request('GET', table, params=params)
+
+    async def fetch_many(self, table: str, filter_sets: Iterable[Filters], **kwargs) -> List[List[Dict]]:
+        """One concurrent fetch per filter set, results in the same order"""
+        return await asyncio.gather(*(self.fetch(table, filters, **kwargs) for filters in filter_sets))
+
+    async def fetch_by_ids(self, table: str, ids: Sequence, select: str = '*', key: str = 'id') -> List[Dict]:
+        filter_sets = ([(key, _in_filter(chunk))] for chunk in _chunks(list(ids), ID_CHUNK_SIZE))
+        pages = await self.fetch_many(table, filter_sets, select=select)
+        return [row for page in pages for row in page]
+
+    # --- Writes --------------------------------------------------------------
+
+    async def insert(self, table: str, rows: Sequence[Dict], returning: bool = False,
+                     chunk_size: int = CHUNK_SIZE) -> Union[int, List[Dict]]:
+        """Bulk insert in concurrent chunks; returns the rows or, by default, the count"""
+        return await self._write(table, rows, [], "return=representation" if returning else "return=minimal",
+                                 returning, chunk_size)
+
+    async def upsert(self, table: str, rows: Sequence[Dict], on_conflict: str, ignore_duplicates: bool = False,
+                     returning: bool = False, chunk_size: int = CHUNK_SIZE) -> Union[int, List[Dict]]:
+        """Bulk INSERT ... ON CONFLICT (on_conflict) DO UPDATE, or DO NOTHING with ignore_duplicates"""
+        resolution = "resolution=ignore-duplicates" if ignore_duplicates else "resolution=merge-duplicates"
+        prefer = f"{resolution},{'return=representation' if returning else 'return=minimal'}"
+        return await self._write(table, rows, [("on_conflict", on_conflict)], prefer, returning, chunk_size)
+
+    async def _write(self, table, rows, params, prefer, returning, chunk_size):
+        chunks = _chunks(list(rows), chunk_size)
+        results = await asyncio.gather(*(self.request('POST', table, params=params, json=list(chunk),
+                                                      headers={"Prefer": prefer}) for chunk in chunks))
+        if returning:
+            return [row for result in results for row in (result or [])]
+        return sum(len(chunk) for chunk in chunks)
+
+    async def patch(self, table: str, filters: Filters, values: Dict) -> None:
+        params = list(filters.items() if isinstance(filters, dict) else filters)
+        await self.request('PATCH', table, params=params, json=values, headers={"Prefer": "return=minimal"})
+
+    async def patch_ids(self, table: str, ids: Sequence, values: Dict, key: str = 'id') -> None:
+        """Same values onto many rows, one id=in.(...) PATCH per chunk"""
+        await asyncio.gather(*(self.patch(table, [(key, _in_filter(chunk))], values)
+                               for chunk in _chunks(list(ids), ID_CHUNK_SIZE)))
+
+    async def patch_many(self, table: str, updates: Iterable[Tuple[Filters, Dict]]) -> None:
+        """Different values per filter, all PATCHes in flight together"""
+        await asyncio.gather(*(self.patch(table, filters, values) for filters, values in updates))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.client.close()
+
+
+class SupabaseData:
+    """
+    Blocking facade for the synchronous scripts: every AsyncSupabase
+    coroutine method becomes a plain call that runs it to completion.
+    """
+
+    def __init__(self, client: Optional[PostgrestClient] = None, concurrency: int = CONCURRENCY):
+        self._async = AsyncSupabase(client, concurrency)
+
+    def __getattr__(self, name):
+        attr = getattr(self._async, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        def run(*args, **kwargs):
+            return asyncio.run(attr(*args, **kwargs))
+        run.__doc__ = attr.__doc__
+        return run
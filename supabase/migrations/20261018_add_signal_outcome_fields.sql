@@ -0,0 +1,18 @@
+-- Migration: Add closed-trade outcome fields for backtesting
+-- Date: 2026-10-18
+-- Description: scripts/backtest-strategy.py reads closed signals with keyset
+-- pagination on (created_at, id) and needs the realised outcome per trade
+
+-- 1. Outcome fields (nullable, filled when a signal is closed)
+ALTER TABLE aisignal
+ADD COLUMN IF NOT EXISTS outcome TEXT,
+ADD COLUMN IF NOT EXISTS profit_percent NUMERIC,
+ADD COLUMN IF NOT EXISTS r_multiple NUMERIC,
+ADD COLUMN IF NOT EXISTS closed_at TIMESTAMPTZ;
+
+-- 2. Keyset pagination index: ORDER BY created_at, id
+CREATE INDEX IF NOT EXISTS idx_aisignal_created_at_id
+ON aisignal(created_at, id);
+
+-- 3. Refresh PostgREST schema cache
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,41 @@
+-- Migration: Claim leases so several analyzers can share the pending queue
+-- Date: 2026-10-18
+-- Description: scripts/analyze_signals.py claims batches through
+-- claim_pending_signals(); concurrent workers skip each other's locked rows
+-- and a claim expires after p_lease_seconds so a crashed worker's rows return
+
+-- 1. Lease columns
+ALTER TABLE aisignal
+ADD COLUMN IF NOT EXISTS claimed_by TEXT,
+ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ;
+
+-- 2. Claim up to p_limit pending rows (optionally only p_ids), oldest first
+CREATE OR REPLACE FUNCTION claim_pending_signals(
+    p_worker TEXT,
+    p_status TEXT DEFAULT 'PENDING',
+    p_limit INTEGER DEFAULT 1000,
+    p_lease_seconds INTEGER DEFAULT 300,
+    p_ids TEXT[] DEFAULT NULL
+)
+RETURNS SETOF aisignal AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE aisignal AS s
+    SET claimed_by = p_worker,
+        claimed_at = now()
+    WHERE s.id IN (
+        SELECT c.id
+        FROM aisignal AS c
+        WHERE c.status = p_status
+          AND (c.claimed_at IS NULL OR c.claimed_at < now() - make_interval(secs => p_lease_seconds))
+          AND (p_ids IS NULL OR c.id::text = ANY(p_ids))
+        ORDER BY c.created_at, c.id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING s.*;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 3. Refresh PostgREST schema cache
+NOTIFY pgrst, 'reload schema';
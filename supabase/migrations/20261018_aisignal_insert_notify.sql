@@ -0,0 +1,20 @@
+-- Migration: Notify listeners when a signal is inserted
+-- Date: 2026-10-18
+-- Description: scripts/analyze_signals.py --daemon LISTENs on 'aisignal_inserted'
+-- and analyzes new signals as soon as they land; the payload is the row id
+
+-- 1. Trigger function
+CREATE OR REPLACE FUNCTION notify_aisignal_inserted()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('aisignal_inserted', NEW.id::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 2. Fire once per inserted row (delivered when the inserting transaction commits)
+DROP TRIGGER IF EXISTS aisignal_insert_notify ON aisignal;
+CREATE TRIGGER aisignal_insert_notify
+AFTER INSERT ON aisignal
+FOR EACH ROW
+EXECUTE FUNCTION notify_aisignal_inserted();
@@ -0,0 +1,17 @@
+-- Migration: Idempotent signal ingestion
+-- Date: 2026-10-18
+-- Description: writers stamp a deterministic signal_key (symbol, direction,
+-- rounded entry, time bucket, source - see scripts/signal_keys.py) and insert
+-- with ON CONFLICT (signal_key), so retries and overlapping runs cannot
+-- create duplicate rows. Rows written without a key stay NULL, and NULLs
+-- never conflict, so legacy writers keep working unchanged.
+
+-- 1. Key column
+ALTER TABLE aisignal
+ADD COLUMN IF NOT EXISTS signal_key TEXT;
+
+-- 2. Unique index (not partial: PostgREST on_conflict needs a plain unique index)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_aisignal_signal_key ON aisignal(signal_key);
+
+-- 3. Refresh PostgREST schema cache
+NOTIFY pgrst, 'reload schema';